@@ -4,13 +4,27 @@ import random
 import logging
 import pytz
 import asyncio
+import copy
+import bisect
+import contextlib
+import contextvars
+import heapq
+import itertools
 import json
+import time
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from discord.ext import commands, tasks
+from logging.handlers import RotatingFileHandler
+from discord.ext import commands
 import discord
 import os
 import re
-from typing import Optional
+import socket
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -23,6 +37,7 @@ logging.getLogger("discord.gateway").setLevel(logging.WARNING)
 logging.getLogger("discord.client").setLevel(logging.WARNING)
 logging.getLogger("discord.http").setLevel(logging.WARNING)
 logging.getLogger("discord.ext.commands").setLevel(logging.ERROR)
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
 
 # Define intents
 intents = discord.Intents.default()
@@ -36,6 +51,37 @@ CET = pytz.timezone('Europe/Stockholm')
 
 # File to store cleaner state
 STATE_FILE = 'cleaner_state.json'  # Update this path as needed
+# File to store in-progress sweep checkpoints (kept across disable/enable)
+CURSOR_FILE = 'cleaner_cursors.json'
+
+# State backend: 'sqlite' (default; imports the JSON files above on first start) or 'json'
+STATE_BACKEND = os.environ.get('CLEANER_STATE_BACKEND', 'sqlite')
+STATE_DB = os.environ.get('CLEANER_STATE_DB', 'cleaner_state.db')
+# Changes made within this many seconds are written together in one transaction
+STATE_FLUSH_DELAY_SECONDS = 1.0
+
+# Active/standby failover: every instance started with CLEANER_LEADER_ELECTION=1 competes
+# for a lease row in the state database (or CLEANER_LEASE_DB); only the holder runs
+# sweeps and answers commands, the others stay connected and take over once it lapses
+LEADER_ELECTION = os.environ.get('CLEANER_LEADER_ELECTION', '').lower() in ('1', 'true', 'yes')
+LEASE_DB = os.environ.get('CLEANER_LEASE_DB', STATE_DB)
+# A lease not renewed for this long may be taken over; the holder renews it much more often
+LEASE_TTL_SECONDS = 10.0
+LEASE_RENEW_SECONDS = 3.0
+
+# One JSON record per sweep (phase timings, counts, optional profile) is appended to
+# this rotating file; set CLEANER_TRACE_FILE to an empty string to turn it off
+TRACE_FILE = os.environ.get('CLEANER_TRACE_FILE', 'cleaner_traces.jsonl')
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUP_COUNT = 3
+# How often (seconds) the sweep profiler samples, for channels where it is turned on
+PROFILE_SAMPLE_SECONDS = 0.02
+# Distinct await stacks kept in a profiled sweep's trace record
+PROFILE_TOP_STACKS = 15
+
+# Port for the Prometheus-style /metrics endpoint on localhost; 0 disables it
+METRICS_PORT = int(os.environ.get('CLEANER_METRICS_PORT', '0'))
+METRICS_HOST = os.environ.get('CLEANER_METRICS_HOST', '127.0.0.1')
 
 
 # List of roles allowed to execute commands
@@ -52,41 +98,306 @@ CLEANING_INTERVAL_MINUTES = 15
 DEFAULT_COOLDOWN_SECONDS = 10
 HELP_COOLDOWN_SECONDS = 30
 
-# Cancellation flags per channel
-CANCEL_FLAGS: dict[int, bool] = {}
+# Scheduled sweeps the central scheduler runs at the same time
+SCHEDULER_MAX_CONCURRENT_SWEEPS = 16
+# Window (seconds) over which first runs are spread out at startup
+SCHEDULER_STARTUP_JITTER_SECONDS = CLEANING_INTERVAL_MINUTES * 60
+
+# Bulk delete limits imposed by the Discord API
+BULK_DELETE_MAX_MESSAGES = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+# Keep clear of the 14-day edge so a batch can't age out while it is in flight
+BULK_DELETE_SAFETY_MARGIN = timedelta(minutes=10)
+
+# Global flag: if True, message events for enabled channels feed an in-memory expiry
+# index so scheduled sweeps can delete without paging history over REST
+GATEWAY_INDEX = False
+
+# Global flag: if True, sweeps also clean the active and archived threads of a channel
+# (and the posts of an enabled forum channel), with the same cutoffs as the channel
+CLEAN_THREADS = True
+# Threads of one channel swept at the same time
+THREAD_SWEEP_CONCURRENCY = 4
+
+# Upper bound for !setcleaningcount (messages kept per channel)
+MAX_KEEP_MESSAGES = 100_000
+
+# !cleanerplan: how long a scan may run, how long its IDs stay reusable by the
+# !testcleaner run that follows it, and the largest scan that is kept at all
+PLAN_SCAN_TIMEOUT_SECONDS = 5 * 60
+PLAN_CACHE_SECONDS = 5 * 60
+PLAN_CACHE_MAX_IDS = 1_000_000
+
+# Batch commands: sweeps of one !batchtest run at the same time (they share the
+# dispatcher's rate budget) and how often its progress message is edited
+BATCH_MAX_CONCURRENT_SWEEPS = 8
+BATCH_PROGRESS_EDIT_SECONDS = 5.0
+
+# Failed deletes remembered per channel and retried on the next scheduled sweep
+MAX_PENDING_RETRIES = 1000
+
+# Sharding: set CLEANER_SHARD_COUNT to run with AutoShardedBot. Leave CLEANER_SHARD_IDS
+# unset to run every shard in this process, or set it (e.g. "0,2") to run only those
+# shards as one of several worker processes started by launcher.py
+SHARD_COUNT = int(os.environ.get('CLEANER_SHARD_COUNT', '0'))
+SHARD_IDS = [int(s) for s in os.environ.get('CLEANER_SHARD_IDS', '').split(',') if s.strip()] or None
+# Worker processes sharing this bot token (set by launcher.py)
+WORKER_COUNT = max(1, int(os.environ.get('CLEANER_WORKERS', '1')))
+
+# Shared deletion dispatcher: every delete from every sweep goes through it.
+# Discord allows 50 requests/second per bot; stay below that globally. The limit is per
+# token, so worker processes split it between them.
+DISPATCH_GLOBAL_RATE = 40.0 / WORKER_COUNT
+# Delete requests in flight across all channels
+DISPATCH_MAX_CONCURRENCY = 8
+# Per-channel pace (requests/second) for each delete route: start at the initial
+# rate, creep up after successes, halve after a 429
+DISPATCH_ROUTE_INITIAL_RATE = 1.0
+DISPATCH_ROUTE_MIN_RATE = 0.2
+DISPATCH_ROUTE_MAX_RATE = 5.0
+DISPATCH_ROUTE_RATE_STEP = 0.1
+# Share of the global budget and of the in-flight slots for each lane: "fast" carries
+# bulk deletes of recent messages, "legacy" the one-by-one deletes of messages older
+# than 14 days, so an old backlog can't starve routine cleanup elsewhere
+DISPATCH_LANE_SHARES = {'fast': 0.75, 'legacy': 0.25}
+
+# Scheduled sweeps checkpoint their scan position every this many history pages
+CHECKPOINT_EVERY_PAGES = 10
+
+# Random wait (seconds) before retrying a history page after a Discord 5xx
+SERVER_ERROR_RETRY_SECONDS = (2.0, 5.0)
+
+# How many scanned pages of message IDs may wait between the history pager and the deleter
+PIPELINE_QUEUE_PAGES = 4
+
+# Deadline (seconds) for one scheduled sweep, so a huge channel can't hold a scheduler
+# slot indefinitely; a sweep cut off here resumes from its checkpoint next interval
+SCHEDULED_SWEEP_TIMEOUT_SECONDS = 10 * 60
+# Deadline for manual !testcleaner runs; None means no limit
+MANUAL_SWEEP_TIMEOUT_SECONDS = None
+# How long !disablecleaner waits for a stopped sweep to unwind before reporting progress
+CANCEL_WAIT_SECONDS = 5.0
 
-def cancel_channel(channel_id: int):
-    CANCEL_FLAGS[channel_id] = True
-
-def clear_cancel(channel_id: int):
-    CANCEL_FLAGS.pop(channel_id, None)
+# ------------------- Persistence -------------------
 
-def is_cancelled(channel_id: int) -> bool:
-    return CANCEL_FLAGS.get(channel_id, False)
+# Fields of a channel's state entry that are sweep progress rather than configuration
+PROGRESS_FIELDS = ('watermark', 'pending', 'legacy_before', 'thread_watermark')
 
-# Load initial state
-def load_state():
-    if os.path.exists(STATE_FILE):
+def load_json_file(path):
+    if os.path.exists(path):
         try:
-            with open(STATE_FILE, 'r') as f:
+            with open(path, 'r') as f:
                 return json.load(f)
         except (json.JSONDecodeError, KeyError) as e:
-            logger.error(f"Error loading state file: {e}")
+            logger.error(f"Error loading state file {path}: {e}")
             return {}
     else:
         return {}
 
-state = load_state()
+def write_json_file(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # e.g. a file bind-mounted into a container can't be replaced; overwrite in place
+        os.remove(tmp_path)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+# Backends receive only changed rows: a dict of key -> row, where None deletes the row.
+# write() always runs on the state writer thread.
+class JsonStateBackend:
+    def load(self):
+        self._channels = load_json_file(STATE_FILE)
+        self._cursors = load_json_file(CURSOR_FILE)
+        return copy.deepcopy(self._channels), copy.deepcopy(self._cursors)
+
+    def write(self, channels: dict, cursors: dict):
+        for rows, target, path in ((channels, self._channels, STATE_FILE), (cursors, self._cursors, CURSOR_FILE)):
+            if not rows:
+                continue
+            for key, row in rows.items():
+                if row is None:
+                    target.pop(key, None)
+                else:
+                    target[key] = row
+            write_json_file(path, target)
+
+    def close(self):
+        pass
+
+class SqliteStateBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS channels (channel_id TEXT PRIMARY KEY, config TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS watermarks (channel_id TEXT PRIMARY KEY, progress TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cursors (channel_id TEXT PRIMARY KEY, cursor TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def load(self):
+        self._migrate_from_json()
+        channels = {}
+        for key, config in self.conn.execute("SELECT channel_id, config FROM channels"):
+            channels[key] = json.loads(config)
+        for key, progress in self.conn.execute("SELECT channel_id, progress FROM watermarks"):
+            if key in channels:
+                channels[key].update(json.loads(progress))
+        cursors = {key: json.loads(cursor) for key, cursor in self.conn.execute("SELECT channel_id, cursor FROM cursors")}
+        return channels, cursors
+
+    def _migrate_from_json(self):
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return
+        channels = load_json_file(STATE_FILE)
+        cursors = load_json_file(CURSOR_FILE)
+        self.write(channels, cursors, extra=[("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)", (datetime.now(CET).isoformat(),))])
+        if channels or cursors:
+            logger.info(f"Migrated {len(channels)} channels and {len(cursors)} sweep cursors from JSON into {self.path}")
+
+    def write(self, channels: dict, cursors: dict, extra=()):
+        with self.conn:
+            for key, row in channels.items():
+                if row is None:
+                    self.conn.execute("DELETE FROM channels WHERE channel_id = ?", (key,))
+                    self.conn.execute("DELETE FROM watermarks WHERE channel_id = ?", (key,))
+                    continue
+                config = {k: v for k, v in row.items() if k not in PROGRESS_FIELDS}
+                progress = {k: v for k, v in row.items() if k in PROGRESS_FIELDS}
+                self.conn.execute(
+                    "INSERT INTO channels (channel_id, config) VALUES (?, ?) ON CONFLICT(channel_id) DO UPDATE SET config = excluded.config",
+                    (key, json.dumps(config)))
+                self.conn.execute(
+                    "INSERT INTO watermarks (channel_id, progress) VALUES (?, ?) ON CONFLICT(channel_id) DO UPDATE SET progress = excluded.progress",
+                    (key, json.dumps(progress)))
+            for key, cursor in cursors.items():
+                if cursor is None:
+                    self.conn.execute("DELETE FROM cursors WHERE channel_id = ?", (key,))
+                else:
+                    self.conn.execute(
+                        "INSERT INTO cursors (channel_id, cursor) VALUES (?, ?) ON CONFLICT(channel_id) DO UPDATE SET cursor = excluded.cursor",
+                        (key, json.dumps(cursor)))
+            for sql, params in extra:
+                self.conn.execute(sql, params)
+
+    def close(self):
+        self.conn.close()
+
+# Keeps the in-memory `state` and `sweep_cursors` dicts durable without blocking the
+# event loop: callers mark the keys they changed, and after a short delay all marked
+# rows are snapshotted and written in one transaction on a single writer thread.
+class StateStore:
+    def __init__(self, backend):
+        self.backend = backend
+        self._dirty_channels: set[str] = set()
+        self._dirty_cursors: set[str] = set()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-writer')
+        self._flush_handle = None
+
+    def load(self):
+        return self.backend.load()
+
+    def mark(self, channel_keys=(), cursor_keys=()):
+        self._dirty_channels.update(str(k) for k in channel_keys)
+        self._dirty_cursors.update(str(k) for k in cursor_keys)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (startup/shutdown): write right away
+            future = self.flush()
+            if future:
+                future.result()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(STATE_FLUSH_DELAY_SECONDS, self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        if not self._dirty_channels and not self._dirty_cursors:
+            return None
+        channels = {k: copy.deepcopy(state.get(k)) for k in self._dirty_channels}
+        cursors = {k: copy.deepcopy(sweep_cursors.get(k)) for k in self._dirty_cursors}
+        self._dirty_channels.clear()
+        self._dirty_cursors.clear()
+        future = self._writer.submit(self.backend.write, channels, cursors)
+        future.add_done_callback(self._log_result)
+        return future
+
+    @staticmethod
+    def _log_result(future):
+        error = future.exception()
+        if error:
+            logger.error(f"Error saving state: {error}")
+        else:
+            logger.debug("State saved successfully")
+
+    # Re-reads everything from the backend (after a failover), behind any pending writes
+    async def reload(self):
+        future = self.flush()
+        if future:
+            await asyncio.wrap_future(future)
+        return await asyncio.wrap_future(self._writer.submit(self.backend.load))
+
+    def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self.flush()
+        self._writer.shutdown(wait=True)
+        self.backend.close()
+
+def make_state_backend():
+    if STATE_BACKEND == 'json':
+        if SHARD_IDS is not None:
+            # every worker would rewrite the whole file with only its own view of it
+            raise SystemExit("Multiple worker processes need the sqlite state backend (CLEANER_STATE_BACKEND=sqlite)")
+        return JsonStateBackend()
+    return SqliteStateBackend(STATE_DB)
+
+# ------------------- Shard ownership -------------------
+
+# True if this process is connected to every guild (not split across worker processes)
+def sees_all_guilds() -> bool:
+    return not SHARD_COUNT or SHARD_IDS is None
+
+def shard_for_guild(guild_id: int) -> int:
+    return (guild_id >> 22) % SHARD_COUNT
+
+# A channel belongs to the worker running its guild's shard. Entries saved before
+# guild IDs were recorded have no owner until the worker that can see them claims them.
+def owns_guild(guild_id: int | None) -> bool:
+    if sees_all_guilds():
+        return True
+    return guild_id is not None and shard_for_guild(guild_id) in SHARD_IDS
+
+# Other workers' channels stay in the shared store; this process never touches them
+def owned_channels(channels: dict) -> dict:
+    return {key: config for key, config in channels.items() if 'guild_id' not in config or owns_guild(config['guild_id'])}
+
+state_store = StateStore(make_state_backend())
+# state: channel ID -> config plus sweep progress (PROGRESS_FIELDS)
+# sweep_cursors: channel ID -> {'windows': [[after, before], ...] still to scan, 'cutoff': sweep cutoff}
+state, sweep_cursors = state_store.load()
+state = owned_channels(state)
+
+def save_state(*channel_ids):
+    state_store.mark(channel_keys=channel_ids)
+
+def save_cursors(*channel_ids):
+    state_store.mark(cursor_keys=channel_ids)
 
 # Initialize bot with intents
-bot = commands.Bot(command_prefix='!', intents=intents)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents)
 
 bot.help_command = None  # Disable default help command
 
-
-# Dictionary to store cleaning tasks for each channel
-cleaning_tasks = {}
-
 # -------------- last<Nd><Nh><Nm> parser --------------
 DURATION_RE = re.compile(
     r"^last(?:(?P<days>\d+)d)?(?:(?P<hours>\d+)h)?(?:(?P<minutes>\d+)m)?$",
@@ -112,73 +423,310 @@ async def on_ready():
     logger.info("#############################################################")
     logger.info(f'Logged in as {bot.user.name}')
 
-    dirty = False
+    # on_ready fires again after a fresh IDENTIFY; events missed meanwhile are not replayed
+    expiry_index.invalidate_all()
+    channel_registry.rebuild()
+
+    if SHARD_COUNT:
+        logger.info(f"Running shards {SHARD_IDS if SHARD_IDS is not None else 'all'} of {SHARD_COUNT} ({len(bot.guilds)} guilds)")
+
+    if LEADER_ELECTION:
+        # channels are scheduled once (and only while) this instance holds the lease
+        leader_lease.start()
+        if leader_lease.is_leader:
+            schedule_enabled_channels()
+    else:
+        schedule_enabled_channels()
+        scheduler.start()
+
+    try:
+        await start_metrics_server()
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint: {e}")
+
+    logger.info("Bot is ready to receive commands")
+
+# Drops stored channels that no longer exist and schedules the rest
+def schedule_enabled_channels():
+    removed = []
+    claimed = []
     for channel_id in list(state.keys()):
         channel_id_int = int(channel_id)
+        config = state[channel_id]
         # verify channel exists in any guild the bot is in
-        found = None
-        for g in bot.guilds:
-            ch = g.get_channel(channel_id_int)
-            if isinstance(ch, discord.TextChannel):
-                found = ch
-                break
+        found = channel_registry.get(channel_id_int)
         if not found:
+            if not sees_all_guilds() and not owns_guild(config.get('guild_id')):
+                # probably another worker's channel from before guild IDs were stored
+                state.pop(channel_id, None)
+                continue
             logger.warning(f"Removing unknown/non-text channel ID from state: {channel_id}")
             state.pop(channel_id, None)
-            dirty = True
+            removed.append(channel_id)
             continue
+        if 'guild_id' not in config:
+            config['guild_id'] = found.guild.id
+            claimed.append(channel_id)
 
-        if channel_id_int not in cleaning_tasks:
-            cleaning_tasks[channel_id_int] = build_cleaner_loop()
-        try:
-            cleaning_tasks[channel_id_int].start(channel_id_int)
-            logger.info(f"Started cleaner task for channel ID: {channel_id_int}")
-        except RuntimeError:
-            logger.warning(f"Task for channel ID: {channel_id_int} is already running")
+        if channel_id_int in scheduler:
+            logger.warning(f"Cleaner for channel ID: {channel_id_int} is already scheduled")
+            continue
+        # spread first runs over the startup window so channels don't all sweep together
+        scheduler.schedule(channel_id_int, first_run_delay() + random.uniform(0, SCHEDULER_STARTUP_JITTER_SECONDS))
+        logger.info(f"Scheduled cleaner for channel ID: {channel_id_int}")
 
-    if dirty:
-        save_state()
+    if removed or claimed:
+        save_state(*removed, *claimed)
 
-    logger.info("Bot is ready to receive commands")
+# A standby instance stays silent until it holds the lease
+@bot.event
+async def on_message(message):
+    if leader_lease.is_leader:
+        await bot.process_commands(message)
+
+@bot.event
+async def on_guild_join(guild):
+    channel_registry.add_guild(guild)
+
+@bot.event
+async def on_guild_available(guild):
+    channel_registry.add_guild(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    channel_registry.remove_guild(guild)
+
+@bot.event
+async def on_guild_update(before, after):
+    channel_registry.add_guild(after)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    channel_registry.track(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    channel_registry.forget(channel.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if isinstance(after, discord.CategoryChannel):
+        # overwrites synced from a category can change every channel under it
+        channel_registry.add_guild(after.guild)
+    else:
+        channel_registry.track(after)
+
+@bot.event
+async def on_guild_role_create(role):
+    channel_registry.add_guild(role.guild)
+
+@bot.event
+async def on_guild_role_delete(role):
+    channel_registry.add_guild(role.guild)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    channel_registry.add_guild(after.guild)
+
+@bot.event
+async def on_member_update(before, after):
+    # our own roles changed (only delivered with the members intent)
+    if bot.user and after.id == bot.user.id:
+        channel_registry.add_guild(after.guild)
+
+# The index only tracks channels it has backfilled (GATEWAY_INDEX or count retention);
+# events for other channels are ignored by it
+@bot.listen('on_message')
+async def index_message(message):
+    expiry_index.add(message.channel.id, message.id)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    expiry_index.discard(payload.channel_id, (payload.message_id,))
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    expiry_index.discard(payload.channel_id, payload.message_ids)
 
 
 # ------------------- Core cleaning job -------------------
 
 async def clean_old_messages(channel_id):
-    # Hard stop if channel was cancelled
-    if is_cancelled(int(channel_id)):
-        logger.info(f"Cleaner cancelled for channel {channel_id}; skipping iteration.")
-        return
-
     config = state.get(str(channel_id))
     if not config:
         logger.warning(f"No configuration found for channel ID: {channel_id}")
         return
 
-    # Find the guild and channel explicitly
-    channel = None
-    for guild in bot.guilds:
-        for ch in guild.text_channels:
-            if ch.id == int(channel_id):
-                channel = ch
-                break
-        if channel:
-            break
-
+    channel = channel_registry.get(int(channel_id))
     if not channel:
         logger.warning(f"Channel not found: {channel_id}")
         return
+    if not channel_registry.can_manage(channel.id):
+        logger.warning(f"Missing Manage Messages in channel {channel_id}; skipping sweep")
+        return
 
+    loop = asyncio.get_running_loop()
+    started = loop.time()
     now = datetime.now(CET)  # Use timezone-aware datetime
-    time_limit = now - timedelta(hours=config['time_to_keep'])
 
-    # One more cancel check just before deleting
-    if is_cancelled(int(channel_id)):
-        logger.info(f"Cleaner cancelled for channel {channel_id}; aborting before delete.")
+    # Everything older than the watermark was handled by an earlier sweep, so only the
+    # window between the previous and the current cutoff needs scanning, plus whatever
+    # earlier sweeps failed to delete
+    time_cutoff_id = 0
+    if config.get('time_to_keep') is not None:
+        time_limit = now - timedelta(hours=config['time_to_keep'])
+        time_cutoff_id = discord.utils.time_snowflake(time_limit, high=False)
+    watermark = config.get('watermark')
+    pending = array('Q', config.get('pending', []))
+    stats = SweepStats(legacy_handoff=True)
+    key = str(channel_id)
+    # a forum channel has no messages of its own, only posts (threads)
+    has_history = isinstance(channel, discord.TextChannel)
+
+    # Everything here (index scans included) shares the sweep's deadline
+    def time_left() -> float:
+        return max(0.0, SCHEDULED_SWEEP_TIMEOUT_SECONDS - (loop.time() - started))
+
+    # Anything older than the time limit goes, and so does anything below the newest N.
+    # Count retention reads the channel's size off the index; while the index is cold,
+    # only the newest N IDs are paged to find the cutoff, and the index is filled above
+    # the cutoff once the sweep below it is through.
+    keep_count = config.get('max_messages') if has_history else None
+    use_index = GATEWAY_INDEX or keep_count is not None
+    cutoff_id = time_cutoff_id
+    if keep_count is not None:
+        if expiry_index.is_warm(channel.id):
+            count_cutoff_id = expiry_index.nth_newest(channel.id, keep_count)
+        else:
+            # the message at the watermark was kept by the last sweep, so it still counts
+            floor = watermark - 1 if watermark else None
+            count_cutoff_id = await run_scoped(channel.id, 'scheduled', stats,
+                                               nth_newest_id(channel, keep_count, floor), time_left())
+            if count_cutoff_id == 0 and not stats.cancelled:
+                # under the cap, everything unswept fits in the index; fill it right away
+                await run_scoped(channel.id, 'scheduled', stats, expiry_index.backfill(channel, floor or 0), time_left())
+        if stats.cancelled:
+            logger.warning(f"Sweep of channel {channel_id} stopped while counting its messages")
+            return
+        cutoff_id = max(cutoff_id, count_cutoff_id)
+    if not cutoff_id and not pending:
+        logger.debug(f"Nothing over the retention limits in channel {channel_id}")
         return
 
-    deleted_count = await delete_messages(channel, time_limit)
+    # A warm index already holds every unswept message ID, so no history is needed
+    from_index = use_index and expiry_index.is_warm(channel.id)
 
+    windows = []
+    cursor = sweep_cursors.get(key)
+    if from_index or not has_history:
+        pass
+    elif cursor:
+        # an interrupted sweep left a checkpoint: finish what it hadn't scanned, plus
+        # whatever expired since its cutoff. Retention may have grown since, so nothing
+        # at or above the current cutoff is scanned.
+        for after, before in cursor['windows']:
+            before = cutoff_id if before is None else min(before, cutoff_id)
+            if after is None or after < before:
+                windows.append((after, before))
+        if cutoff_id > cursor['cutoff']:
+            windows.append((cursor['cutoff'], cutoff_id))
+    elif cutoff_id and (watermark is None or watermark < cutoff_id):
+        windows.append((watermark, cutoff_id))
+
+    # Legacy messages handed to a background drain that didn't finish (e.g. across a
+    # restart) sit below the watermark; rescan that region too
+    rescan_legacy = bool(config.get('legacy_before')) and not legacy_lane.is_draining(channel.id)
+    if rescan_legacy:
+        windows.append((None, config['legacy_before']))
+    windows = merge_windows(windows)
+
+    # Retries are only due once they are below the cutoff; the rest stay pending
+    retries = array('Q', (i for i in pending if i < cutoff_id))
+    deferred = array('Q', (i for i in pending if i >= cutoff_id))
+
+    # IDs taken out of the index go back in if the sweep is interrupted before it got rid of them
+    expired_pages = []
+    popped = array('Q')
+    if from_index:
+        expired_pages = expiry_index.pop_expired(channel.id, cutoff_id)
+        for ids in expired_pages:
+            popped.extend(ids)
+        stats.handled_ids = array('Q')
+
+    async def sweep_pages():
+        for ids in expired_pages:
+            stats.candidates += len(ids)
+            yield ids
+        async for item in window_pages(channel, windows, stats, CHECKPOINT_EVERY_PAGES):
+            yield item
+        if retries:
+            stats.candidates += len(retries)
+            yield retries
+
+    # Deletes that failed in windows a checkpoint has moved past would never be seen
+    # again, so they join the retries carried over from earlier sweeps
+    def keep_failures(failed):
+        if failed:
+            retries = dict.fromkeys(pending.tolist() + failed.tolist())
+            config['pending'] = list(retries)[-MAX_PENDING_RETRIES:]
+
+    def checkpoint(remaining):
+        if state.get(key) is not config:
+            return
+        sweep_cursors[key] = {'windows': [list(w) for w in remaining], 'cutoff': cutoff_id}
+        save_cursors(key)
+        keep_failures(stats.failed_ids)
+        if stats.legacy_handed_off and config.get('legacy_before', 0) <= stats.legacy_newest_id:
+            config['legacy_before'] = stats.legacy_newest_id + 1
+        save_state(key)
+
+    await run_sweep(channel, sweep_pages(), stats, on_checkpoint=checkpoint, kind='scheduled',
+                    timeout=time_left())
+    deleted_count = stats.deleted
+
+    # Only a finished sweep may move the watermark; skip if the channel was disabled meanwhile
+    if not stats.cancelled and state.get(key) is config:
+        if sweep_cursors.pop(key, None) is not None:
+            save_cursors(key)
+        config['watermark'] = max(watermark or 0, cutoff_id)
+        if stats.failed_ids or deferred:
+            config['pending'] = (deferred + stats.failed_ids)[-MAX_PENDING_RETRIES:].tolist()
+        else:
+            config.pop('pending', None)
+        if stats.legacy_handed_off:
+            # remember where the handed-off backlog starts until its drain finishes
+            config['legacy_before'] = max(config.get('legacy_before', 0), stats.legacy_newest_id + 1)
+        elif rescan_legacy:
+            config.pop('legacy_before', None)
+        save_state(key)
+        if use_index and has_history and not from_index:
+            # the window below the cutoff is clean; index everything from it up
+            await run_scoped(channel.id, 'scheduled', stats, expiry_index.backfill(channel, cutoff_id - 1), time_left())
+    else:
+        restored = set()
+        if from_index:
+            handled = set(stats.handled_ids)
+            restored = {i for i in popped if i not in handled}
+            expiry_index.restore(channel.id, restored)
+        failed = array('Q', (i for i in stats.failed_ids if i not in restored))
+        if state.get(key) is config and failed:
+            keep_failures(failed)
+            save_state(key)
+
+    # Threads share the channel's time cutoff (a message count applies to the channel
+    # itself). They keep their own watermark (set once a thread pass completes) so threads
+    # with nothing new since the last pass are skipped.
+    remaining = time_left()
+    if CLEAN_THREADS and time_cutoff_id and not stats.cancelled and remaining > 0 and state.get(key) is config:
+        thread_watermark = config.get('thread_watermark')
+        thread_stats = await sweep_threads(channel, thread_watermark, time_cutoff_id, kind='scheduled', timeout=remaining)
+        deleted_count += thread_stats.deleted
+        if not thread_stats.cancelled and state.get(key) is config:
+            config['thread_watermark'] = max(thread_watermark or 0, time_cutoff_id)
+            save_state(key)
+
+    if stats.legacy_handed_off:
+        logger.info(f"Queued {stats.legacy_handed_off} messages older than 14 days for background deletion in channel {channel_id} (backlog: {legacy_lane.backlog(channel.id)})")
     if deleted_count > 0:
         logger.info(f"Cleaned {deleted_count} messages in channel {channel_id}")
     else:
@@ -187,24 +735,374 @@ async def clean_old_messages(channel_id):
 def has_moderator_role(ctx):
     return any(role.name in MODERATOR_ROLES for role in ctx.author.roles)
 
-def build_cleaner_loop():
-    @tasks.loop(minutes=CLEANING_INTERVAL_MINUTES)
-    async def _loop(channel_id):
-        await clean_old_messages(channel_id)
-
-    @_loop.before_loop
-    async def _before():
-        # ensure bot is ready, then delay one full interval before first run
+def first_run_delay() -> float:
+    # optionally delay one full interval before the first run
+    return CLEANING_INTERVAL_MINUTES * 60 if START_DELAY else 0.0
+
+# ------------------- Scheduler -------------------
+
+# One task drives every enabled channel: a min-heap keyed by each channel's next due
+# time, so the scheduler sleeps until the earliest one instead of keeping a loop per
+# channel. Rescheduling pushes a fresh entry under a new generation (O(log n)); entries
+# whose generation is no longer current are discarded lazily when they reach the top.
+class CleanerScheduler:
+    def __init__(self, interval_seconds: float, max_concurrent: int):
+        self.interval = interval_seconds
+        self._heap: list[tuple[float, int, int]] = []  # (due, generation, channel_id)
+        self._generations: dict[int, int] = {}
+        self._counter = itertools.count()
+        self._running: dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._generations
+
+    def __len__(self) -> int:
+        return len(self._generations)
+
+    def schedule(self, channel_id: int, delay: float = 0.0):
+        generation = next(self._counter)
+        self._generations[channel_id] = generation
+        due = asyncio.get_running_loop().time() + delay
+        heapq.heappush(self._heap, (due, generation, channel_id))
+        if self._heap[0][1] == generation:
+            self._wakeup.set()
+
+    def unschedule(self, channel_id: int):
+        self._generations.pop(channel_id, None)
+        task = self._running.pop(channel_id, None)
+        if task and not task.done():
+            task.cancel()
+
+    def unschedule_all(self):
+        for channel_id in list(self._generations):
+            self.unschedule(channel_id)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _is_live(self, generation: int, channel_id: int) -> bool:
+        return self._generations.get(channel_id) == generation
+
+    async def _run(self):
         await bot.wait_until_ready()
-        if START_DELAY:
-            await asyncio.sleep(CLEANING_INTERVAL_MINUTES * 60)
+        loop = asyncio.get_running_loop()
+        while True:
+            # drop entries superseded by a reschedule or removed by unschedule
+            while self._heap and not self._is_live(self._heap[0][1], self._heap[0][2]):
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            due, generation, channel_id = self._heap[0]
+            delay = due - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            SCHEDULER_LAG.observe(loop.time() - due)
+            if channel_id in self._running:
+                # previous sweep still going; try again next interval
+                logger.warning(f"Sweep for channel {channel_id} still running; skipping this interval")
+                self._push(channel_id, generation, due + self.interval)
+                continue
+            self._running[channel_id] = asyncio.create_task(self._sweep(channel_id, generation, due))
+
+    def _push(self, channel_id: int, generation: int, due: float):
+        if self._is_live(generation, channel_id):
+            heapq.heappush(self._heap, (due, generation, channel_id))
+
+    async def _sweep(self, channel_id: int, generation: int, due: float):
+        try:
+            async with self._slots:
+                await clean_old_messages(channel_id)
+        except asyncio.CancelledError:
+            logger.info(f"Scheduled sweep for channel {channel_id} was cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Error in scheduled sweep for channel {channel_id}: {e}")
+        finally:
+            if self._running.get(channel_id) is asyncio.current_task():
+                self._running.pop(channel_id, None)
+            # next run one interval after this one was due (never in the past)
+            loop = asyncio.get_running_loop()
+            self._push(channel_id, generation, max(due + self.interval, loop.time()))
+
+scheduler = CleanerScheduler(CLEANING_INTERVAL_MINUTES * 60, SCHEDULER_MAX_CONCURRENT_SWEEPS)
+
+# ------------------- Channel registry -------------------
+
+# Channels that can be enabled: text channels, and forum channels for their posts
+CLEANABLE_CHANNEL_TYPES = (discord.TextChannel, discord.ForumChannel)
+
+# Cleanable channels by ID, with whether the bot has Manage Messages in each. Built on ready
+# and kept current from guild, channel and role events, so resolving a channel for a
+# sweep is a dict lookup and channels we can't clean are skipped before any API call.
+class ChannelRegistry:
+    def __init__(self):
+        self._channels: dict[int, discord.TextChannel | discord.ForumChannel] = {}
+        self._can_manage: dict[int, bool] = {}
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._channels
 
-    return _loop
+    def get(self, channel_id: int):
+        return self._channels.get(channel_id)
+
+    def can_manage(self, channel_id: int) -> bool:
+        return self._can_manage.get(channel_id, False)
+
+    def track(self, channel):
+        if not isinstance(channel, CLEANABLE_CHANNEL_TYPES):
+            self.forget(channel.id)
+            return
+        self._channels[channel.id] = channel
+        me = channel.guild.me
+        self._can_manage[channel.id] = me is not None and channel.permissions_for(me).manage_messages
+
+    def forget(self, channel_id: int):
+        self._channels.pop(channel_id, None)
+        self._can_manage.pop(channel_id, None)
+
+    # Also re-evaluates permissions for a guild that is already tracked
+    def add_guild(self, guild):
+        for channel in itertools.chain(guild.text_channels, guild.forums):
+            self.track(channel)
+
+    def remove_guild(self, guild):
+        for channel_id in [ch_id for ch_id, ch in self._channels.items() if ch.guild.id == guild.id]:
+            self.forget(channel_id)
+
+    def rebuild(self):
+        self._channels.clear()
+        self._can_manage.clear()
+        for guild in bot.guilds:
+            self.add_guild(guild)
+
+channel_registry = ChannelRegistry()
+
+# ------------------- Leader election -------------------
+
+# A lease is one row (name, holder, expires) in a shared sqlite file. The holder renews
+# it every LEASE_RENEW_SECONDS; anyone may take it over once `expires` has passed. The
+# upsert only succeeds for the current holder or on an expired row, so at most one
+# instance holds it at a time. Expiry uses wall-clock time because it is compared
+# across processes.
+class LeaderLease:
+    def __init__(self, path: str, name: str, enabled: bool):
+        self.path = path
+        self.name = name
+        self.enabled = enabled
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.expires = 0.0
+        self._leading = False
+        self._conn: sqlite3.Connection | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return not self.enabled or (self._leading and time.time() < self.expires)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=LEASE_RENEW_SECONDS)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            with self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL)")
+        return self._conn
+
+    # Takes or renews the lease; returns its new expiry, or None if someone else holds it
+    def _try_acquire(self) -> float | None:
+        conn = self._connect()
+        now = time.time()
+        expires = now + LEASE_TTL_SECONDS
+        with conn:
+            conn.execute(
+                "INSERT INTO leases (name, holder, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires "
+                "WHERE leases.holder = excluded.holder OR leases.expires < ?",
+                (self.name, self.holder, expires, now))
+            row = conn.execute("SELECT holder FROM leases WHERE name = ?", (self.name,)).fetchone()
+        return expires if row and row[0] == self.holder else None
+
+    def release(self):
+        if not self.enabled or not self._leading:
+            return
+        self._leading = False
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+        except sqlite3.Error as e:
+            logger.error(f"Could not release leader lease: {e}")
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        logger.info(f"Competing for leader lease '{self.name}' as {self.holder}")
+        while True:
+            try:
+                expires = await asyncio.to_thread(self._try_acquire)
+                lost = expires is None  # another instance holds it
+            except sqlite3.Error as e:
+                logger.warning(f"Leader lease check failed: {e}")
+                expires = None
+                # couldn't renew in time, so a standby may already be running sweeps
+                lost = time.time() >= self.expires
+            if expires is not None:
+                self.expires = expires
+                if not self._leading:
+                    self._leading = True
+                    try:
+                        await self._take_over()
+                    except Exception as e:
+                        logger.error(f"Takeover failed, releasing leader lease: {e}")
+                        self._step_down()
+                        self.release()
+            elif self._leading and lost:
+                self._leading = False
+                self._step_down()
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+
+    async def _take_over(self):
+        logger.info(f"Acquired leader lease '{self.name}'; resuming from persisted state")
+        # the previous leader kept writing until it stopped; start from what it left
+        channels, cursors = await state_store.reload()
+        state.clear()
+        state.update(owned_channels(channels))
+        sweep_cursors.clear()
+        sweep_cursors.update(cursors)
+        expiry_index.invalidate_all()
+        schedule_enabled_channels()
+        scheduler.start()
+
+    def _step_down(self):
+        logger.warning(f"Lost leader lease '{self.name}'; stopping sweeps and standing by")
+        scheduler.unschedule_all()
+        legacy_lane.drop_all()
+        expiry_index.invalidate_all()
+
+# One lease per shard set, so each sharded worker can have its own standby
+leader_lease = LeaderLease(LEASE_DB, f"cleaner:{','.join(map(str, SHARD_IDS)) if SHARD_IDS is not None else 'all'}", LEADER_ELECTION)
+
+# ------------------- Gateway expiry index -------------------
+
+# Per-channel, time-ordered arrays of the message IDs seen on the gateway (snowflakes
+# sort by creation time, so expiry is a prefix of the array). A channel is "warm" once
+# a history backfill has covered everything above its last sweep cutoff; from then on
+# message events keep it current and expired IDs can be popped straight into the deleter.
+class ExpiryIndex:
+    def __init__(self):
+        self._ids: dict[int, array] = {}
+        self._backfilling: set[int] = set()
+
+    def is_warm(self, channel_id: int) -> bool:
+        return channel_id in self._ids and channel_id not in self._backfilling
+
+    def invalidate(self, channel_id: int):
+        self._ids.pop(channel_id, None)
+
+    def invalidate_all(self):
+        self._ids.clear()
+
+    def add(self, channel_id: int, message_id: int):
+        ids = self._ids.get(channel_id)
+        if ids is None:
+            return
+        if not ids or message_id > ids[-1]:
+            ids.append(message_id)
+        else:
+            bisect.insort(ids, message_id)
+
+    def discard(self, channel_id: int, message_ids):
+        ids = self._ids.get(channel_id)
+        if not ids:
+            return
+        for message_id in message_ids:
+            pos = bisect.bisect_left(ids, message_id)
+            if pos < len(ids) and ids[pos] == message_id:
+                del ids[pos]
+
+    # ID of the n-th newest message (everything below it is over a count of n), or 0 if
+    # the channel holds no more than n
+    def nth_newest(self, channel_id: int, n: int) -> int:
+        ids = self._ids.get(channel_id)
+        if not ids or len(ids) <= n:
+            return 0
+        return ids[-n]
+
+    # Puts back IDs taken by pop_expired that an interrupted sweep didn't get rid of
+    def restore(self, channel_id: int, message_ids):
+        ids = self._ids.get(channel_id)
+        if ids is None:
+            return  # invalidated (or disabled) meanwhile
+        self._ids[channel_id] = array('Q', sorted(set(ids).union(message_ids)))
+
+    # Removes and returns the IDs below `cutoff_id` in newest-first pages of 100
+    def pop_expired(self, channel_id: int, cutoff_id: int) -> list[array]:
+        ids = self._ids.get(channel_id)
+        if not ids:
+            return []
+        split = bisect.bisect_left(ids, cutoff_id)
+        expired = ids[:split]
+        del ids[:split]
+        expired.reverse()
+        return [expired[i:i + 100] for i in range(0, len(expired), 100)]
+
+    async def backfill(self, channel, after_id: int):
+        ch_id = channel.id
+        # start tracking first so messages arriving during the scan aren't missed
+        live = self._ids.setdefault(ch_id, array('Q'))
+        self._backfilling.add(ch_id)
+        scanned = array('Q')
+        stats = SweepStats()
+        try:
+            async for ids in history_id_pages(channel, None, after_id, stats):
+                scanned.extend(ids)
+        except Exception as e:
+            logger.warning(f"Gateway index backfill failed for channel {ch_id}: {e}")
+            stats.cancelled = True
+        except asyncio.CancelledError:
+            self.invalidate(ch_id)
+            raise
+        finally:
+            self._backfilling.discard(ch_id)
+        if stats.cancelled:
+            self.invalidate(ch_id)
+            return
+        if self._ids.get(ch_id) is not live:
+            return  # invalidated while scanning
+        self._ids[ch_id] = array('Q', sorted(set(scanned).union(live)))
+        logger.info(f"Gateway index backfilled {len(scanned)} messages for channel {ch_id}")
+
+expiry_index = ExpiryIndex()
+
+# ID of the n-th newest message above `after_id`, or 0 if there are fewer than n:
+# pages only as far back as the count reaches, so a cold count-retention channel
+# learns its cutoff without scanning its whole history
+async def nth_newest_id(channel, n: int, after_id: int | None) -> int:
+    seen = 0
+    async for ids in history_id_pages(channel, None, after_id, SweepStats()):
+        if seen + len(ids) >= n:
+            return ids[n - seen - 1]
+        seen += len(ids)
+    return 0
 
 # ------------------- Commands -------------------
 @bot.command(name='enablecleaner')
 @commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
-async def enable_cleaner(ctx, channel: Optional[discord.TextChannel] = None):
+async def enable_cleaner(ctx, channel: Optional[Union[discord.TextChannel, discord.ForumChannel]] = None):
 
     if not has_moderator_role(ctx):
         if RESPOND_TO_NON_MODS:
@@ -222,17 +1120,14 @@ async def enable_cleaner(ctx, channel: Optional[discord.TextChannel] = None):
             logger.warning(f"Missing Manage Messages in channel {target_channel_id}")
             return
 
-        state[str(target_channel_id)] = {'time_to_keep': 24}
-        save_state()
+        state[str(target_channel_id)] = {'time_to_keep': 24, 'guild_id': target_channel.guild.id}
+        save_state(target_channel_id)
+        channel_registry.track(target_channel)
 
-        if target_channel_id not in cleaning_tasks:
-            cleaning_tasks[target_channel_id] = build_cleaner_loop()
-        try:
-            cleaning_tasks[target_channel_id].start(target_channel_id)
-        except RuntimeError:
-            logger.warning(f"Task for channel ID: {target_channel_id} is already running")
-
-        clear_cancel(target_channel_id)
+        if target_channel_id in scheduler:
+            logger.warning(f"Cleaner for channel ID: {target_channel_id} is already scheduled")
+        else:
+            scheduler.schedule(target_channel_id, first_run_delay())
 
         await ctx.send(f"Cleaner enabled for {target_channel.mention} (ID: {target_channel_id})")
         logger.info(f"Cleaner enabled for channel ID: {target_channel_id} by {ctx.author}")
@@ -249,20 +1144,40 @@ async def enable_cleaner_error(ctx, error):
     else:
         logger.error(f"An error occurred in enable_cleaner: {error}")
 
+# HOURS|off argument of the cleaning-time commands; None turns the time limit off
+def parse_cleaning_time(value: str) -> int | None:
+    if value.lower() == 'off':
+        return None
+    if not value.isdigit() or int(value) not in range(1, 73):  # Allow time from 1 to 72 hours
+        raise ValueError(value)
+    return int(value)
+
 @bot.command(name='setcleaningtime')
 @commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
-async def set_cleaning_time(ctx, hours: int):
+async def set_cleaning_time(ctx, hours: str):
     if has_moderator_role(ctx):
         channel_id = ctx.channel.id
-        if hours not in range(1, 73):  # Allow time from 1 to 72 hours
-            await ctx.send("Invalid time. Please set it to a value between 1 and 72 hours.")
+        # 'off' leaves only the message count in force
+        try:
+            hours = parse_cleaning_time(hours)
+        except ValueError:
+            await ctx.send("Invalid time. Please set it to a value between 1 and 72 hours, or `off` to keep only a message count.")
             logger.warning(f"Invalid cleaning time set by {ctx.author}: {hours} hours")
             return
 
         if str(channel_id) in state:
-            state[str(channel_id)]['time_to_keep'] = hours
-            save_state()
-            await ctx.send(f"Cleaning time set to {hours} hours for channel ID: {channel_id}")
+            config = state[str(channel_id)]
+            if hours is None and config.get('max_messages') is None:
+                await ctx.send("Set a message count with `!setcleaningcount` before turning the cleaning time off.")
+                return
+            config['time_to_keep'] = hours
+            save_state(channel_id)
+            # apply the new retention on the next scheduler tick
+            scheduler.schedule(channel_id)
+            if hours is None:
+                await ctx.send(f"Cleaning time turned off for channel ID: {channel_id}; keeping the last {config['max_messages']} messages")
+            else:
+                await ctx.send(f"Cleaning time set to {hours} hours for channel ID: {channel_id}")
             logger.info(f"Cleaning time set to {hours} hours for channel ID: {channel_id} by {ctx.author}")
         else:
             await ctx.send(f"Cleaner is not enabled for channel ID: {channel_id}")
@@ -279,6 +1194,67 @@ async def set_cleaning_time_error(ctx, error):
     else:
         logger.error(f"An error occurred in set_cleaning_time: {error}")
 
+@bot.command(name='setcleaningcount')
+@commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
+async def set_cleaning_count(ctx, count: str):
+    if has_moderator_role(ctx):
+        channel_id = ctx.channel.id
+        # 'off' removes the count and leaves only the cleaning time in force
+        if count.lower() == 'off':
+            count = None
+        elif not count.isdigit() or int(count) not in range(1, MAX_KEEP_MESSAGES + 1):
+            await ctx.send(f"Invalid count. Please set it to a value between 1 and {MAX_KEEP_MESSAGES}, or `off`.")
+            logger.warning(f"Invalid cleaning count set by {ctx.author}: {count}")
+            return
+        else:
+            count = int(count)
+
+        if str(channel_id) in state:
+            config = state[str(channel_id)]
+            if count is None and config.get('time_to_keep') is None:
+                await ctx.send("Set a cleaning time with `!setcleaningtime` before turning the message count off.")
+                return
+            if count is None:
+                config.pop('max_messages', None)
+                # the index was only kept for the count
+                if not GATEWAY_INDEX:
+                    expiry_index.invalidate(channel_id)
+            else:
+                config['max_messages'] = count
+            save_state(channel_id)
+            scheduler.schedule(channel_id)
+            if count is None:
+                await ctx.send(f"Message count turned off for channel ID: {channel_id}")
+            else:
+                await ctx.send(f"Keeping the last {count} messages in channel ID: {channel_id}")
+            logger.info(f"Cleaning count set to {count} for channel ID: {channel_id} by {ctx.author}")
+        else:
+            await ctx.send(f"Cleaner is not enabled for channel ID: {channel_id}")
+            logger.warning(f"{ctx.author} tried to set cleaning count for a channel that is not enabled: {channel_id}")
+    else:
+        if RESPOND_TO_NON_MODS:
+            await ctx.send("You do not have the required permissions to use this command.")
+        logger.warning(f"{ctx.author} tried to set cleaning count without required permissions")
+
+@set_cleaning_count.error
+async def set_cleaning_count_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        pass
+    else:
+        logger.error(f"An error occurred in set_cleaning_count: {error}")
+
+# The (older_than, newer_than) range a `!testcleaner TIME` argument selects, or None
+def test_range(time: str, now: datetime):
+    delta = parse_last_duration(time)
+    if delta:
+        return None, now - delta
+    if time.lower() == 'all':
+        return now, datetime(1970, 1, 1, tzinfo=CET)
+    try:
+        return now - timedelta(hours=int(time)), None
+    except ValueError:
+        return None
+
 @bot.command(name='testcleaner')
 @commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
 async def test_cleaner(ctx, time: str):
@@ -290,40 +1266,28 @@ async def test_cleaner(ctx, time: str):
             return
 
         channel = ctx.channel
-        now = datetime.now(CET)  # timezone-aware
-
-        # handle 'last...' forms (e.g., last5m, last1h25m, last2d)
-        delta = parse_last_duration(time)
-        if delta:
-            start_time = now - delta
-            await ctx.send(f"Deleting messages from the last {delta}.")
-            logger.info(f"Testing cleaner: deleting messages NEWER than {start_time.isoformat()} in channel {channel_id}")
-            deleted_count = await delete_messages(channel, older_than=None, newer_than=start_time)
-            await ctx.send(f"Test complete. Deleted {deleted_count} messages.")
-            logger.info(f"Test cleaner completed (last…). Deleted {deleted_count} messages in channel {channel_id}")
+        # shared with !cleanerplan, whose scan this run reuses only if the bounds match
+        bounds = test_range(time, datetime.now(CET))  # timezone-aware
+        if bounds is None:
+            await ctx.send("Invalid time. Use 'all', a number of hours (e.g., `12`), or `last<Nd><Nh><Nm>` like `last35m`, `last1h25m`, `last2d`.")
+            logger.error(f"Invalid time specified by {ctx.author} for testcleaner: {time}")
             return
+        older_than, newer_than = bounds
 
-        # Existing behavior: 'all'
-        if time.lower() == 'all':
+        if older_than is None:
+            # 'last...' forms (e.g., last5m, last1h25m, last2d)
+            await ctx.send(f"Deleting messages from the last {parse_last_duration(time)}.")
+            logger.info(f"Testing cleaner: deleting messages NEWER than {newer_than.isoformat()} in channel {channel_id}")
+        elif newer_than is not None:
             await ctx.send("Deleting all messages in the channel.")
             logger.info(f"Testing cleaner: deleting all messages in channel {channel_id}")
-            deleted_count = await delete_messages(channel, older_than=now, newer_than=datetime(1970, 1, 1, tzinfo=CET))
-            await ctx.send(f"Test complete. Deleted {deleted_count} messages.")
-            logger.info(f"Test cleaner completed. Deleted {deleted_count} messages in channel {channel_id}")
-            return
-
-        # Existing behavior: numeric hours => delete older than N hours
-        try:
-            hours = int(time)
-            time_limit = now - timedelta(hours=hours)
-            await ctx.send(f"Deleting messages older than {hours} hours.")
-            logger.info(f"Testing cleaner: deleting messages older than {hours} hours in channel {channel_id}")
-            deleted_count = await delete_messages(channel, older_than=time_limit)
-            await ctx.send(f"Test complete. Deleted {deleted_count} messages.")
-            logger.info(f"Test cleaner completed. Deleted {deleted_count} messages in channel {channel_id}")
-        except ValueError:
-            await ctx.send("Invalid time. Use 'all', a number of hours (e.g., `12`), or `last<Nd><Nh><Nm>` like `last35m`, `last1h25m`, `last2d`.")
-            logger.error(f"Invalid time specified by {ctx.author} for testcleaner: {time}")
+        else:
+            # numeric hours => delete older than N hours
+            await ctx.send(f"Deleting messages older than {int(time)} hours.")
+            logger.info(f"Testing cleaner: deleting messages older than {int(time)} hours in channel {channel_id}")
+        deleted_count = await delete_messages(channel, older_than=older_than, newer_than=newer_than)
+        await ctx.send(f"Test complete. Deleted {deleted_count} messages.")
+        logger.info(f"Test cleaner completed ({time}). Deleted {deleted_count} messages in channel {channel_id}")
     else:
         if RESPOND_TO_NON_MODS:
             await ctx.send("You do not have the required permissions to use this command.")
@@ -336,6 +1300,54 @@ async def test_cleaner_error(ctx, error):
     else:
         logger.error(f"An error occurred in test_cleaner: {error}")
 
+@bot.command(name='cleanerplan')
+@commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
+async def cleaner_plan(ctx, time: str):
+    if not has_moderator_role(ctx):
+        if RESPOND_TO_NON_MODS:
+            await ctx.send("You do not have the required permissions to use this command.")
+        logger.warning(f"{ctx.author} tried to plan a cleaner run without required permissions")
+        return
+    channel = ctx.channel
+    if not isinstance(channel, discord.TextChannel):
+        await ctx.send("Run `!cleanerplan` in the text channel you want to preview.")
+        return
+    bounds = test_range(time, datetime.now(CET))
+    if bounds is None:
+        await ctx.send("Invalid time. Use 'all', a number of hours (e.g., `12`), or `last<Nd><Nh><Nm>` like `last35m`, `last1h25m`, `last2d`.")
+        return
+
+    await ctx.send(f"Scanning what `!testcleaner {time}` would delete (nothing is deleted)…")
+    before, after_id = snowflake_bounds(*bounds)
+    plan = await plan_sweep(channel, before, after_id)
+    logger.info(f"{ctx.author} planned `!testcleaner {time}` in channel {channel.id}: {plan.bulk} bulk, {plan.single} single in {plan.pages} pages")
+
+    delete_minutes = projected_delete_seconds(plan) / 60
+    lines = [
+        f"**{'At least ' if not plan.complete else ''}{plan.total}** messages would be deleted in {channel.mention}:",
+        f"- {plan.bulk} younger than 14 days, bulk deleted in {plan.bulk_calls} requests",
+        f"- {plan.single} older than 14 days, deleted one by one",
+        f"- scanned {plan.pages} history pages in {plan.scan_seconds:.0f}s",
+        f"- projected delete time at the current rate: ~{delete_minutes:.0f} min",
+    ]
+    if plan.ids:
+        oldest = discord.utils.snowflake_time(plan.ids[-1])
+        lines.append(f"- oldest message: {oldest.astimezone(CET):%Y-%m-%d %H:%M}")
+    if not plan.complete:
+        lines.append(f"The scan stopped after {PLAN_SCAN_TIMEOUT_SECONDS // 60} min, so these are lower bounds.")
+    elif channel.id in sweep_plans:
+        lines.append(f"A `!testcleaner {time}` within {PLAN_CACHE_SECONDS // 60} min reuses this scan.")
+    if CLEAN_THREADS:
+        lines.append("Threads are not included in the preview.")
+    await ctx.send("\n".join(lines))
+
+@cleaner_plan.error
+async def cleaner_plan_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        pass
+    else:
+        logger.error(f"An error occurred in cleaner_plan: {error}")
+
 @bot.command(name='cleanersetting')
 @commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
 async def cleaner_setting(ctx):
@@ -346,9 +1358,19 @@ async def cleaner_setting(ctx):
         return
     channel_id = str(ctx.channel.id)
     if channel_id in state:
-        time_to_keep = state[channel_id]['time_to_keep']
-        await ctx.send(f"Cleaner is enabled for this channel. Cleaning time is set to {time_to_keep} hours.")
-        logger.info(f"{ctx.author} checked cleaner setting for channel ID: {channel_id} - enabled with {time_to_keep} hours")
+        config = state[channel_id]
+        limits = []
+        if config.get('time_to_keep') is not None:
+            limits.append(f"cleaning time is set to {config['time_to_keep']} hours")
+        if config.get('max_messages') is not None:
+            limits.append(f"keeping the last {config['max_messages']} messages")
+        message = f"Cleaner is enabled for this channel; {' and '.join(limits)}."
+        backlog = legacy_lane.backlog(ctx.channel.id)
+        if backlog:
+            eta_minutes = legacy_lane.eta_seconds(ctx.channel.id) / 60
+            message += f" {backlog} messages older than 14 days are queued for deletion (~{eta_minutes:.0f} min left)."
+        await ctx.send(message)
+        logger.info(f"{ctx.author} checked cleaner setting for channel ID: {channel_id} - enabled with {' and '.join(limits)}")
     else:
         await ctx.send("Cleaner is not enabled for this channel.")
         logger.info(f"{ctx.author} checked cleaner setting for channel ID: {channel_id} - not enabled")
@@ -360,6 +1382,37 @@ async def cleaner_setting_error(ctx, error):
     else:
         logger.error(f"An error occurred in cleaner_setting: {error}")
 
+@bot.command(name='cleanerprofile')
+@commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
+async def cleaner_profile(ctx, channel: Optional[discord.TextChannel] = None):
+    if not has_moderator_role(ctx):
+        if RESPOND_TO_NON_MODS:
+            await ctx.send("You do not have the required permissions to use this command.")
+        logger.warning(f"{ctx.author} tried to toggle the sweep profiler without required permissions")
+        return
+    if not TRACE_FILE:
+        await ctx.send("Sweep traces are turned off (`CLEANER_TRACE_FILE`), so there is nowhere to write a profile.")
+        return
+
+    target_channel = channel or ctx.channel
+    if target_channel.id in profiled_channels:
+        profiled_channels.discard(target_channel.id)
+        await ctx.send(f"Profiler turned off for sweeps in {target_channel.mention}.")
+        logger.info(f"{ctx.author} turned the sweep profiler off for channel ID: {target_channel.id}")
+    else:
+        profiled_channels.add(target_channel.id)
+        await ctx.send(f"Profiler turned on for sweeps in {target_channel.mention}. Each sweep's profile is written to `{TRACE_FILE}`; run the command again to turn it off.")
+        logger.info(f"{ctx.author} turned the sweep profiler on for channel ID: {target_channel.id}")
+
+@cleaner_profile.error
+async def cleaner_profile_error(ctx, error):
+    if isinstance(error, commands.BadArgument):
+        await ctx.send("I couldn’t find that channel. Use a channel **mention** or **ID** from this server, or run `!cleanerprofile` in the channel.")
+    elif isinstance(error, commands.CommandOnCooldown):
+        pass
+    else:
+        logger.error(f"An error occurred in cleaner_profile: {error}")
+
 @bot.command(name='checkpermissions')
 @commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
 async def check_permissions(ctx):
@@ -389,7 +1442,7 @@ async def list_channels(ctx):
 
 @bot.command(name='disablecleaner')
 @commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
-async def disable_cleaner(ctx, channel: Optional[discord.TextChannel] = None):
+async def disable_cleaner(ctx, channel: Optional[Union[discord.TextChannel, discord.ForumChannel]] = None):
 
     if not has_moderator_role(ctx):
         if RESPOND_TO_NON_MODS:
@@ -401,28 +1454,26 @@ async def disable_cleaner(ctx, channel: Optional[discord.TextChannel] = None):
     target_channel_id = target_channel.id
     key = str(target_channel_id)
 
-    # 1) cancel any active sweep immediately
-    cancel_channel(target_channel_id)
+    # 1) cancel any active sweep immediately, and wait for it to stop so its progress is final
+    stopped = await sweep_scopes.cancel_channel(target_channel_id, 'disabled')
 
-    # 2) stop and remove scheduled task if present (and hard-cancel its task)
-    loop_task = cleaning_tasks.get(target_channel_id)
-    if loop_task:
-        try:
-            loop_task.stop()
-            t = getattr(loop_task, "_task", None)
-            if t and not t.done():
-                t.cancel()
-            logger.info(f"Stopped cleaner task for channel ID: {target_channel_id}")
-        except Exception as e:
-            logger.warning(f"Error stopping task for channel ID {target_channel_id}: {e}")
-        cleaning_tasks.pop(target_channel_id, None)
+    # 2) remove from the schedule (and hard-cancel a running sweep)
+    if target_channel_id in scheduler:
+        scheduler.unschedule(target_channel_id)
+        logger.info(f"Stopped cleaner task for channel ID: {target_channel_id}")
+
+    expiry_index.invalidate(target_channel_id)
+    legacy_lane.drop(target_channel_id)
 
     # 3) remove from state and persist
     if key in state:
         state.pop(key, None)
-        save_state()
+        save_state(key)
 
-    await ctx.send(f"Cleaner disabled for {target_channel.mention} (ID: {target_channel_id})")
+    message = f"Cleaner disabled for {target_channel.mention} (ID: {target_channel_id})"
+    for scope in stopped:
+        message += f"\nStopped a {scope.kind} sweep after deleting {scope.stats.deleted} of {scope.stats.candidates} messages found."
+    await ctx.send(message)
     logger.info(f"{ctx.author} disabled cleaner for channel ID: {target_channel_id}")
 
 
@@ -436,6 +1487,213 @@ async def disable_cleaner_error(ctx, error):
         logger.error(f"An error occurred in disable_cleaner: {error}")
 
 
+# ------------------- Batch commands -------------------
+
+# Channels named by batch TARGETS: `guild` (every text and forum channel of the server),
+# categories (their text and forum channels), and channel mentions or IDs. Returns the
+# channels, deduplicated and in order, and the arguments that named no cleanable channel.
+async def resolve_batch_targets(ctx, targets) -> tuple[list, list[str]]:
+    channels = {}
+    unknown = []
+    for target in targets:
+        if target.lower() == 'guild':
+            found = ctx.guild.text_channels + ctx.guild.forums
+        else:
+            try:
+                found = await commands.GuildChannelConverter().convert(ctx, target)
+            except commands.BadArgument:
+                unknown.append(target)
+                continue
+            if isinstance(found, discord.CategoryChannel):
+                found = found.text_channels + found.forums
+            elif isinstance(found, CLEANABLE_CHANNEL_TYPES):
+                found = [found]
+            else:
+                unknown.append(target)
+                continue
+        for channel in found:
+            channels.setdefault(channel.id, channel)
+    return list(channels.values()), unknown
+
+# Splits channels by whether the bot has Manage Messages in them
+def split_by_permission(ctx, channels) -> tuple[list, list]:
+    allowed, missing = [], []
+    for channel in channels:
+        (allowed if channel.permissions_for(ctx.guild.me).manage_messages else missing).append(channel)
+    return allowed, missing
+
+def mention_list(channels, limit: int = 15) -> str:
+    text = ", ".join(channel.mention for channel in channels[:limit])
+    if len(channels) > limit:
+        text += f" and {len(channels) - limit} more"
+    return text
+
+# Summary lines shared by the batch commands for the targets they had to leave out
+def skipped_lines(unknown, missing, not_enabled=()) -> list[str]:
+    lines = []
+    if missing:
+        lines.append(f"Skipped, no **Manage Messages**: {mention_list(missing)}")
+    if not_enabled:
+        lines.append(f"Skipped, cleaner not enabled: {mention_list(not_enabled)}")
+    if unknown:
+        lines.append(f"Not found: {', '.join(unknown[:15])}")
+    return lines
+
+BATCH_TARGETS_HELP = "Name the channels: `guild`, a category, or channel mentions/IDs (any mix)."
+
+@bot.command(name='batchenable')
+@commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
+async def batch_enable(ctx, *targets: str):
+    if not has_moderator_role(ctx):
+        if RESPOND_TO_NON_MODS:
+            await ctx.send("You do not have the required permissions to use this command.")
+        logger.warning(f"{ctx.author} tried to batch enable the cleaner without required permissions")
+        return
+    if not targets:
+        await ctx.send(BATCH_TARGETS_HELP)
+        return
+
+    channels, unknown = await resolve_batch_targets(ctx, targets)
+    allowed, missing = split_by_permission(ctx, channels)
+    new = [channel for channel in allowed if str(channel.id) not in state]
+
+    for channel in new:
+        state[str(channel.id)] = {'time_to_keep': 24, 'guild_id': channel.guild.id}
+        channel_registry.track(channel)
+    save_state(*(channel.id for channel in new))
+    for channel in new:
+        if channel.id not in scheduler:
+            scheduler.schedule(channel.id, first_run_delay())
+
+    lines = [f"Cleaner enabled for {len(new)} channels ({len(allowed) - len(new)} already enabled)."]
+    lines += skipped_lines(unknown, missing)
+    await ctx.send("\n".join(lines))
+    logger.info(f"{ctx.author} batch enabled the cleaner for {len(new)} channels: {[channel.id for channel in new]}")
+
+@batch_enable.error
+async def batch_enable_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        pass
+    else:
+        logger.error(f"An error occurred in batch_enable: {error}")
+
+@bot.command(name='batchsettime')
+@commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
+async def batch_set_time(ctx, hours: str, *targets: str):
+    if not has_moderator_role(ctx):
+        if RESPOND_TO_NON_MODS:
+            await ctx.send("You do not have the required permissions to use this command.")
+        logger.warning(f"{ctx.author} tried to batch set cleaning time without required permissions")
+        return
+    try:
+        hours = parse_cleaning_time(hours)
+    except ValueError:
+        await ctx.send("Invalid time. Please set it to a value between 1 and 72 hours, or `off` to keep only a message count.")
+        return
+    if not targets:
+        await ctx.send(BATCH_TARGETS_HELP)
+        return
+
+    channels, unknown = await resolve_batch_targets(ctx, targets)
+    allowed, missing = split_by_permission(ctx, channels)
+    enabled = [channel for channel in allowed if str(channel.id) in state]
+    not_enabled = [channel for channel in allowed if str(channel.id) not in state]
+    # the time limit can only be turned off where a message count takes over
+    no_count = [channel for channel in enabled if hours is None and state[str(channel.id)].get('max_messages') is None]
+    updated = [channel for channel in enabled if channel not in no_count]
+
+    for channel in updated:
+        state[str(channel.id)]['time_to_keep'] = hours
+    save_state(*(channel.id for channel in updated))
+    for channel in updated:
+        scheduler.schedule(channel.id)
+
+    setting = "turned off" if hours is None else f"set to {hours} hours"
+    lines = [f"Cleaning time {setting} for {len(updated)} channels."]
+    lines += skipped_lines(unknown, missing, not_enabled)
+    if no_count:
+        lines.append(f"Kept, no message count set: {mention_list(no_count)}")
+    await ctx.send("\n".join(lines))
+    logger.info(f"{ctx.author} batch set cleaning time to {hours} hours for {len(updated)} channels: {[channel.id for channel in updated]}")
+
+@batch_set_time.error
+async def batch_set_time_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        pass
+    else:
+        logger.error(f"An error occurred in batch_set_time: {error}")
+
+@bot.command(name='batchtest')
+@commands.cooldown(1, DEFAULT_COOLDOWN_SECONDS, commands.BucketType.user)
+async def batch_test(ctx, time: str, *targets: str):
+    if not has_moderator_role(ctx):
+        if RESPOND_TO_NON_MODS:
+            await ctx.send("You do not have the required permissions to use this command.")
+        logger.warning(f"{ctx.author} tried to batch test the cleaner without required permissions")
+        return
+    bounds = test_range(time, datetime.now(CET))
+    if bounds is None:
+        await ctx.send("Invalid time. Use 'all', a number of hours (e.g., `12`), or `last<Nd><Nh><Nm>` like `last35m`, `last1h25m`, `last2d`.")
+        return
+    if not targets:
+        await ctx.send(BATCH_TARGETS_HELP)
+        return
+
+    channels, unknown = await resolve_batch_targets(ctx, targets)
+    allowed, missing = split_by_permission(ctx, channels)
+    enabled = [channel for channel in allowed if str(channel.id) in state]
+    not_enabled = [channel for channel in allowed if str(channel.id) not in state]
+    skipped = skipped_lines(unknown, missing, not_enabled)
+    if not enabled:
+        await ctx.send("\n".join(["No channels to clean."] + skipped))
+        return
+
+    deleted: dict[int, int] = {}
+    failed = []
+    slots = asyncio.Semaphore(BATCH_MAX_CONCURRENT_SWEEPS)
+
+    async def sweep(channel):
+        async with slots:
+            try:
+                deleted[channel.id] = await delete_messages(channel, *bounds)
+            except Exception as e:
+                logger.error(f"Batch test failed in channel {channel.id}: {e}")
+                failed.append(channel)
+
+    # finished channels report their totals; running ones their live progress
+    def render(finished: bool) -> str:
+        running = [channel for channel in enabled if channel.id not in deleted and sweep_scopes.active(channel.id)]
+        live = sum(scope.stats.deleted for channel in running for scope in sweep_scopes.active(channel.id))
+        total = sum(deleted.values()) + live
+        done = len(deleted) + len(failed)
+        if finished:
+            lines = [f"Batch test `{time}` finished: {total} messages deleted in {len(deleted)} channels."]
+        else:
+            lines = [f"Batch test `{time}`: {done}/{len(enabled)} channels done, {len(running)} running, {total} messages deleted so far."]
+        if failed:
+            lines.append(f"Failed: {mention_list(failed)}")
+        return "\n".join(lines + skipped)
+
+    logger.info(f"{ctx.author} started a batch test ({time}) of {len(enabled)} channels: {[channel.id for channel in enabled]}")
+    progress = await ctx.send(render(False))
+    tasks = {asyncio.create_task(sweep(channel)) for channel in enabled}
+    pending = tasks
+    while pending:
+        _, pending = await asyncio.wait(pending, timeout=BATCH_PROGRESS_EDIT_SECONDS)
+        try:
+            await progress.edit(content=render(not pending))
+        except discord.HTTPException as e:
+            logger.debug(f"Could not update batch progress message: {e}")
+    logger.info(f"Batch test ({time}) finished: {sum(deleted.values())} messages deleted in {len(deleted)} channels")
+
+@batch_test.error
+async def batch_test_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        pass
+    else:
+        logger.error(f"An error occurred in batch_test: {error}")
+
+
 @bot.command(name='cleanerhelp')
 @commands.cooldown(1, HELP_COOLDOWN_SECONDS, commands.BucketType.user)
 async def cleaner_help(ctx):
@@ -448,10 +1706,14 @@ async def cleaner_help(ctx):
     footer = "Feel free to ask for help if you need more information."
 
     help_text = (
-        "- `!enablecleaner [CHANNEL_ID]` - Enable the cleaner. If CHANNEL_ID is omitted, it enables in the current channel. Default interval: 24h.\n"
-        "- `!setcleaningtime HOURS` - Set the cleaning interval for the current channel. HOURS must be between 1 and 72.\n"
+        "- `!enablecleaner [CHANNEL_ID]` - Enable the cleaner for a text or forum channel (threads included). If CHANNEL_ID is omitted, it enables in the current channel. Default interval: 24h.\n"
+        "- `!setcleaningtime HOURS|off` - Set the cleaning interval for the current channel. HOURS must be between 1 and 72; `off` keeps only a message count.\n"
+        "- `!setcleaningcount N|off` - Keep only the last N messages in the current channel (with or without a cleaning time).\n"
         "- `!testcleaner TIME` - Test run. TIME can be 'all', a number of hours (e.g., `12`), or `last<Nd><Nh><Nm>` like `last35m`, `last1h25m`, `last2d`.\n"
-        "- `!cleanersetting` - Check if the cleaner is enabled for the current channel and the cleaning interval.\n"
+        "- `!batchenable TARGETS`, `!batchsettime HOURS|off TARGETS`, `!batchtest TIME TARGETS` - Batch versions for many channels at once. TARGETS: `guild`, categories, or channel mentions/IDs.\n"
+        "- `!cleanerplan TIME` - Preview a `!testcleaner TIME` run: how many messages it would delete, how many are past the 14-day bulk limit and how long it would take. Nothing is deleted.\n"
+        "- `!cleanersetting` - Check if the cleaner is enabled for the current channel and its retention limits.\n"
+        "- `!cleanerprofile [CHANNEL_ID]` - Toggle the sweep profiler for a channel. Profiles are written with the sweep traces.\n"
         "- `!checkpermissions` - Check your permissions id.\n"
         "- `!listchannels` - List all channels + channel_id.\n"
         "- `!disablecleaner [CHANNEL_ID]` - Disable the cleaner (full stop, cancels in-flight and removes schedule). If CHANNEL_ID is omitted, disables it in the current channel.\n"
@@ -482,67 +1744,1020 @@ async def cleaner_help_error(ctx, error):
     else:
         logger.error(f"An error occurred in cleaner_help: {error}")
 
-# ------------------- Deletion routine (interruptible) -------------------
+# ------------------- Metrics -------------------
+
+# Minimal Prometheus text-format metrics; label values are passed as keyword arguments
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: dict[tuple, float] = {}
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def _format(key: tuple, extra: tuple = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + self._format(key), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name} {value:g}" for name, value in self.samples())
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    # `collect` returns (labels, value) pairs when the endpoint is scraped
+    def __init__(self, name: str, help_text: str, collect):
+        super().__init__(name, help_text)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name + self._format(self._key(labels)), value
+
+class Histogram(Metric):
+    kind = 'histogram'
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.setdefault(key, [0] * (len(self.BUCKETS) + 2))
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        for key, series in self.series.items():
+            for bound, count in zip(self.BUCKETS, series):
+                yield self.name + '_bucket' + self._format(key, (('le', f'{bound:g}'),)), count
+            yield self.name + '_bucket' + self._format(key, (('le', '+Inf'),)), series[-1]
+            yield self.name + '_sum' + self._format(key), series[-2]
+            yield self.name + '_count' + self._format(key), series[-1]
+
+HISTORY_PAGES = Counter('cleaner_history_pages_total', 'History pages fetched while scanning')
+HISTORY_SECONDS = Histogram('cleaner_history_request_seconds', 'Latency of one history page request')
+SERVER_ERROR_RETRIES = Counter('cleaner_server_error_retries_total', 'DiscordServerError responses that were retried')
+MESSAGES_DELETED = Counter('cleaner_messages_deleted_total', 'Messages deleted, by delete mode')
+DELETE_SECONDS = Histogram('cleaner_delete_request_seconds', 'Latency of one delete request, by route')
+RATE_LIMITED = Counter('cleaner_rate_limited_total', '429 responses observed, by route')
+SWEEP_SECONDS = Histogram('cleaner_sweep_duration_seconds', 'Duration of a sweep, by kind')
+SWEEPS = Counter('cleaner_sweeps_total', 'Sweeps run, by kind and result')
+SCHEDULER_LAG = Histogram('cleaner_scheduler_lag_seconds', 'How late scheduled sweeps started compared to their due time')
+LEGACY_BACKLOG = Gauge('cleaner_legacy_backlog', 'Messages older than 14 days queued for deletion, by channel',
+                       lambda: [({'channel': ch}, n) for ch, n in legacy_lane.backlogs().items()])
+SCHEDULED_CHANNELS = Gauge('cleaner_scheduled_channels', 'Channels known to the scheduler',
+                           lambda: [({}, len(scheduler))])
+LEADER = Gauge('cleaner_leader', '1 if this instance runs sweeps (holds the leader lease), 0 on standby',
+               lambda: [({}, 1 if leader_lease.is_leader else 0)])
+
+METRICS = (
+    HISTORY_PAGES, HISTORY_SECONDS, SERVER_ERROR_RETRIES, MESSAGES_DELETED, DELETE_SECONDS,
+    RATE_LIMITED, SWEEP_SECONDS, SWEEPS, SCHEDULER_LAG, LEGACY_BACKLOG, SCHEDULED_CHANNELS, LEADER,
+)
 
-async def delete_messages(channel, older_than: datetime | None, newer_than: datetime | None = None):
-    deleted_count = 0
-    messages_to_delete = []
-    before_message = None
-    ch_id = channel.id
+def render_metrics() -> str:
+    return '\n'.join(metric.render() for metric in METRICS) + '\n'
+
+metrics_runner = None
 
-    # Scan history and collect candidates
+async def start_metrics_server():
+    global metrics_runner
+    if not METRICS_PORT or metrics_runner is not None:
+        return
+    from aiohttp import web  # ships with discord.py
+
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    metrics_runner = web.AppRunner(app)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+# ------------------- Tracing -------------------
+
+# Each sweep carries a SweepTrace in a context variable, so code deep in the pipeline
+# (the pager, the deleter, the dispatcher) can time its phases without it being passed
+# around. Spans are aggregated per phase (count, total, max) rather than kept one by one.
+current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+
+trace_logger = logging.getLogger('cleaner.trace')
+trace_logger.propagate = False
+if TRACE_FILE:
+    _trace_handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT)
+    _trace_handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_logger.addHandler(_trace_handler)
+    trace_logger.setLevel(logging.INFO)
+
+# Channels whose sweeps run with the sampling profiler (toggled by !cleanerprofile)
+profiled_channels: set[int] = set()
+
+class SweepTrace:
+    def __init__(self, kind: str, channel_id: int):
+        self.kind = kind
+        self.channel_id = channel_id
+        self.started_at = datetime.now(CET)
+        self.started = time.monotonic()
+        self.phases: dict[str, list] = {}  # phase -> [count, total seconds, max seconds]
+        self.profile: dict[str, int] | None = None
+
+    def add(self, phase: str, seconds: float):
+        entry = self.phases.setdefault(phase, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+    def record(self, result: str, stats) -> dict:
+        record = {
+            'ts': self.started_at.isoformat(),
+            'kind': self.kind,
+            'channel': self.channel_id,
+            'result': result,
+            'duration_s': round(time.monotonic() - self.started, 3),
+            'pages': stats.pages_scanned,
+            'candidates': stats.candidates,
+            'bulk_deleted': stats.bulk_deleted,
+            'single_deleted': stats.single_deleted,
+            'legacy_handed_off': stats.legacy_handed_off,
+            'failed': len(stats.failed_ids),
+            'phases': {
+                phase: {'count': count, 'total_s': round(total, 4), 'max_s': round(longest, 4)}
+                for phase, (count, total, longest) in self.phases.items()
+            },
+        }
+        if self.profile is not None:
+            top = sorted(self.profile.items(), key=lambda item: -item[1])[:PROFILE_TOP_STACKS]
+            record['profile'] = {
+                'interval_s': PROFILE_SAMPLE_SECONDS,
+                'samples': sum(self.profile.values()),
+                'stacks': [{'stack': stack, 'samples': n} for stack, n in top],
+            }
+        return record
+
+@contextlib.contextmanager
+def span(phase: str):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.monotonic() - started)
+
+# Where a coroutine is suspended, outermost first ("clean_old_messages:512 > run_sweep:1630 > ...")
+def await_stack(coro) -> str:
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append(f"{frame.f_code.co_name}:{frame.f_lineno}")
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return ' > '.join(frames)
+
+# Wall-clock sampling profiler for one sweep: samples the await stacks of the sweep's
+# tasks on the event loop, so time spent waiting on Discord or on rate limits shows up
+# as well as time spent computing
+async def profile_tasks(trace: SweepTrace, tasks):
+    trace.profile = {}
     while True:
-        if is_cancelled(ch_id):
-            logger.warning(f"Deletion cancelled for channel {ch_id} while scanning.")
-            return deleted_count
+        await asyncio.sleep(PROFILE_SAMPLE_SECONDS)
+        for task in tasks:
+            if not task.done():
+                stack = await_stack(task.get_coro())
+                trace.profile[stack] = trace.profile.get(stack, 0) + 1
+
+# ------------------- Cancellation scopes -------------------
+
+# A running sweep: the tasks doing its work and its stats, which are its progress.
+# Cancelling the scope cancels the tasks, so an in-flight history request, delete call
+# or backoff sleep is interrupted at once instead of at the next check between pages.
+class SweepScope:
+    def __init__(self, channel_id: int, kind: str, stats, tasks):
+        self.channel_id = channel_id
+        self.kind = kind
+        self.stats = stats
+        self.tasks = tasks
+        self.reason: str | None = None
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+        for task in self.tasks:
+            task.cancel()
+
+    async def wait(self, timeout: float | None = None):
+        await asyncio.wait(self.tasks, timeout=timeout)
+
+# Scopes of the sweeps currently running, by channel. A scope exists only while its
+# sweep runs, so there is no flag to go stale once a channel is stopped.
+class SweepScopes:
+    def __init__(self):
+        self._scopes: dict[int, set[SweepScope]] = {}
+
+    def open(self, channel_id: int, kind: str, stats, tasks) -> SweepScope:
+        scope = SweepScope(channel_id, kind, stats, tasks)
+        self._scopes.setdefault(channel_id, set()).add(scope)
+        return scope
+
+    def close(self, scope: SweepScope):
+        scopes = self._scopes.get(scope.channel_id)
+        if scopes is not None:
+            scopes.discard(scope)
+            if not scopes:
+                del self._scopes[scope.channel_id]
+
+    def active(self, channel_id: int) -> list[SweepScope]:
+        return list(self._scopes.get(channel_id, ()))
+
+    # Stops every sweep of the channel and waits (briefly) until they have unwound
+    async def cancel_channel(self, channel_id: int, reason: str) -> list[SweepScope]:
+        scopes = self.active(channel_id)
+        for scope in scopes:
+            scope.cancel(reason)
+        for scope in scopes:
+            await scope.wait(CANCEL_WAIT_SECONDS)
+        return scopes
+
+sweep_scopes = SweepScopes()
+
+# Runs a step of a sweep that isn't part of its pipeline (e.g. an index scan) as its
+# own task inside a scope of the channel, so disabling the channel or the sweep's
+# deadline interrupts it too. Returns the step's result, or None with
+# `stats.cancelled` set if it was interrupted.
+async def run_scoped(channel_id: int, kind: str, stats, coro, timeout: float | None):
+    task = asyncio.create_task(coro)
+    scope = sweep_scopes.open(channel_id, kind, stats, (task,))
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if not done:
+            scope.cancel('deadline')
+            await asyncio.wait({task})
+        if task.cancelled():
+            stats.cancelled = True
+            return None
+        return task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+        sweep_scopes.close(scope)
+
+# ------------------- Deletion dispatcher -------------------
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds: float):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+# Every delete from every sweep goes through one dispatcher: a per-(route, channel)
+# token bucket paces each Discord rate-limit bucket, a global bucket keeps the sum
+# under the bot-wide limit, and each priority lane gets its own share of that budget
+# and of the requests in flight. Route rates
+# grow additively on success and halve on a 429 (AIMD), and rate-limit headers on
+# error responses block a bucket until Discord says it resets.
+class DeletionDispatcher:
+    def __init__(self, global_rate: float, max_concurrency: int, lane_shares: dict[str, float]):
+        self._global = TokenBucket(global_rate, global_rate)
+        self._routes: dict[tuple[str, int], TokenBucket] = {}
+        self._lanes: dict[str, TokenBucket] = {}
+        self._lane_slots: dict[str, asyncio.Semaphore] = {}
+        for lane, share in lane_shares.items():
+            lane_rate = global_rate * share
+            self._lanes[lane] = TokenBucket(lane_rate, max(1.0, lane_rate))
+            self._lane_slots[lane] = asyncio.Semaphore(max(1, round(max_concurrency * share)))
+
+    def lane_rate(self, lane: str) -> float:
+        return self._lanes[lane].rate
+
+    def route_rate(self, route: str, channel_id: int) -> float:
+        bucket = self._routes.get((route, channel_id))
+        return bucket.rate if bucket else DISPATCH_ROUTE_INITIAL_RATE
+
+    def _bucket(self, route: str, channel_id: int) -> TokenBucket:
+        bucket = self._routes.get((route, channel_id))
+        if bucket is None:
+            bucket = TokenBucket(DISPATCH_ROUTE_INITIAL_RATE, 1)
+            self._routes[(route, channel_id)] = bucket
+        return bucket
+
+    async def submit(self, route: str, channel_id: int, call, lane: str = 'fast'):
+        bucket = self._bucket(route, channel_id)
+        with span('rate_limit_wait'):
+            await bucket.acquire()
+        async with self._lane_slots[lane]:
+            with span('rate_limit_wait'):
+                await self._lanes[lane].acquire()
+                await self._global.acquire()
+            started = time.monotonic()
+            try:
+                with span(route):
+                    result = await call()
+            except discord.HTTPException as e:
+                self._observe_error(route, bucket, e)
+                raise
+            finally:
+                DELETE_SECONDS.observe(time.monotonic() - started, route=route)
+        bucket.rate = min(DISPATCH_ROUTE_MAX_RATE, bucket.rate + DISPATCH_ROUTE_RATE_STEP)
+        return result
+
+    def on_rate_limited(self, route: str | None, channel_id: int | None, retry_after: float, is_global: bool = False):
+        RATE_LIMITED.inc(route='global' if is_global else route)
+        if is_global:
+            self._global.block_for(retry_after)
+            return
+        bucket = self._routes.get((route, channel_id))
+        if bucket is not None:
+            bucket.rate = max(DISPATCH_ROUTE_MIN_RATE, bucket.rate / 2)
+            bucket.block_for(retry_after)
+
+    def _observe_error(self, route: str, bucket: TokenBucket, error: discord.HTTPException):
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            if error.status == 429:
+                RATE_LIMITED.inc(route=route)
+                retry_after = float(headers.get('Retry-After', 1))
+                if headers.get('X-RateLimit-Global'):
+                    self._global.block_for(retry_after)
+                else:
+                    bucket.rate = max(DISPATCH_ROUTE_MIN_RATE, bucket.rate / 2)
+                    bucket.block_for(retry_after)
+            elif headers.get('X-RateLimit-Remaining') == '0':
+                bucket.block_for(float(headers.get('X-RateLimit-Reset-After', 1)))
+        except (TypeError, ValueError):
+            pass
+
+deletion_dispatcher = DeletionDispatcher(DISPATCH_GLOBAL_RATE, DISPATCH_MAX_CONCURRENCY, DISPATCH_LANE_SHARES)
+
+# Background drain of messages too old for bulk delete. Scheduled sweeps hand their
+# legacy IDs over and finish, and one drainer per channel works through them on the
+# throttled legacy lane, so a big old backlog neither holds a scheduler slot nor eats
+# into the fast lane.
+class LegacyLane:
+    def __init__(self):
+        self._queues: dict[int, deque[array]] = {}
+        self._backlog: dict[int, int] = {}
+        self._drainers: dict[int, asyncio.Task] = {}
+
+    def backlog(self, channel_id: int) -> int:
+        return self._backlog.get(channel_id, 0)
+
+    def backlogs(self) -> dict[int, int]:
+        return dict(self._backlog)
+
+    def is_draining(self, channel_id: int) -> bool:
+        return channel_id in self._drainers
+
+    # Rough time to clear a channel's backlog at the current pace of its delete route
+    # and its share of the legacy lane
+    def eta_seconds(self, channel_id: int) -> float:
+        lane_rate = deletion_dispatcher.lane_rate('legacy') / max(1, len(self._drainers))
+        rate = min(deletion_dispatcher.route_rate('delete_message', channel_id), lane_rate)
+        return self.backlog(channel_id) / rate
+
+    def enqueue(self, channel, ids: array):
+        ch_id = channel.id
+        self._queues.setdefault(ch_id, deque()).append(ids)
+        self._backlog[ch_id] = self.backlog(ch_id) + len(ids)
+        if ch_id not in self._drainers:
+            self._drainers[ch_id] = asyncio.create_task(self._drain(channel))
+
+    def drop_all(self):
+        for channel_id in list(self._drainers):
+            self.drop(channel_id)
+
+    def drop(self, channel_id: int):
+        task = self._drainers.get(channel_id)
+        self._forget(channel_id)
+        if task and not task.done():
+            task.cancel()
+
+    def _forget(self, channel_id: int):
+        self._drainers.pop(channel_id, None)
+        self._queues.pop(channel_id, None)
+        self._backlog.pop(channel_id, None)
+
+    async def _drain(self, channel):
+        # the drain outlives the sweep that started it; keep its deletes out of that trace
+        current_trace.set(None)
+        ch_id = channel.id
+        stats = SweepStats()
+        queue = self._queues[ch_id]
         try:
-            page = []
-            async for msg in channel.history(limit=100, before=before_message):
-                page.append(msg)
+            while queue:
+                for message_id in queue.popleft():
+                    await _single_delete(channel, message_id, stats, lane='legacy')
+                    self._backlog[ch_id] -= 1
+        except asyncio.CancelledError:
+            stats.cancelled = True
+            raise
+        finally:
+            # forget the channel without drop(), which would cancel this very task
+            if self._drainers.get(ch_id) is asyncio.current_task():
+                self._forget(ch_id)
+            logger.info(f"Legacy drain for channel {ch_id} {'stopped' if stats.cancelled else 'finished'}: {stats.single_deleted} messages deleted")
+        config = state.get(str(ch_id))
+        if config is not None:
+            config.pop('legacy_before', None)
+            if stats.failed_ids:
+                pending = array('Q', config.get('pending', [])) + stats.failed_ids
+                config['pending'] = pending[-MAX_PENDING_RETRIES:].tolist()
+            save_state(ch_id)
+
+legacy_lane = LegacyLane()
+
+# discord.py retries 429s internally and only reports them through its logger, so
+# feed those reports back into the dispatcher's buckets
+RATE_LIMIT_RE = re.compile(r"We are being rate limited\. \w+ (?P<url>\S+) responded with 429\. Retrying in (?P<retry>[\d.]+)")
+GLOBAL_RATE_LIMIT_RE = re.compile(r"Global rate limit has been hit\. Retrying in (?P<retry>[\d.]+)")
+DELETE_ROUTE_RE = re.compile(r"/channels/(?P<channel>\d+)/messages/(?P<target>bulk-delete|\d+)$")
+
+class RateLimitObserver(logging.Handler):
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            return
+        m = GLOBAL_RATE_LIMIT_RE.search(message)
+        if m:
+            deletion_dispatcher.on_rate_limited(None, None, float(m.group('retry')), is_global=True)
+            return
+        m = RATE_LIMIT_RE.search(message)
+        if not m:
+            return
+        route = DELETE_ROUTE_RE.search(m.group('url'))
+        if route:
+            name = 'bulk_delete' if route.group('target') == 'bulk-delete' else 'delete_message'
+            deletion_dispatcher.on_rate_limited(name, int(route.group('channel')), float(m.group('retry')))
+
+logging.getLogger("discord.http").addHandler(RateLimitObserver())
+
+# ------------------- Deletion routine (interruptible) -------------------
+
+# Translate datetime bounds into a server-side `before` cursor and an `after` floor ID:
+# messages older than `older_than` sort below its snowflake, messages at or after
+# `newer_than` have IDs above the floor.
+def snowflake_bounds(older_than: datetime | None, newer_than: datetime | None):
+    before = None
+    after_id = None
+    if older_than is not None:
+        before = discord.Object(id=discord.utils.time_snowflake(older_than, high=False))
+    if newer_than is not None:
+        after_id = max(0, discord.utils.time_snowflake(newer_than, high=False) - 1)
+    return before, after_id
+
+@dataclass
+class SweepStats:
+    pages_scanned: int = 0
+    candidates: int = 0
+    bulk_deleted: int = 0
+    single_deleted: int = 0
+    batch_latencies: list[float] = field(default_factory=list)
+    failed_ids: array = field(default_factory=lambda: array('Q'))
+    # scheduled sweeps hand legacy (>14 day) IDs to the background lane instead of waiting
+    legacy_handoff: bool = False
+    legacy_handed_off: int = 0
+    legacy_newest_id: int = 0
+    cancelled: bool = False
+    # when set, every ID the deleter got rid of (deleted, already gone or handed off)
+    handled_ids: array | None = None
+
+    @property
+    def deleted(self) -> int:
+        return self.bulk_deleted + self.single_deleted
+
+# Pages newest-first from `before` and yields the IDs of each page above `after_id`,
+# stopping as soon as a page crosses the floor or the history runs out
+async def history_id_pages(channel, before, after_id: int | None, stats: SweepStats):
+    while True:
+        started = time.monotonic()
+        try:
+            page = array('Q')
+            with span('history_page'):
+                async for msg in channel.history(limit=100, before=before, oldest_first=False):
+                    page.append(msg.id)
         except discord.errors.DiscordServerError as e:
             logger.warning(f"500 fetching history, retrying… ({e})")
-            await asyncio.sleep(2 + random.random() * 3)
+            SERVER_ERROR_RETRIES.inc(operation='history')
+            with span('server_error_backoff'):
+                await asyncio.sleep(random.uniform(*SERVER_ERROR_RETRY_SECONDS))
             continue
+        HISTORY_SECONDS.observe(time.monotonic() - started)
+        HISTORY_PAGES.inc()
 
         if not page:
-            break
+            return
+        stats.pages_scanned += 1
 
-        for msg in page:
-            cond_old = (older_than is not None and msg.created_at < older_than)
-            cond_new = (newer_than is not None and msg.created_at >= newer_than)
-            if older_than is None and newer_than is None:
-                # nothing to delete if no condition given
-                continue
-            if cond_old or cond_new:
-                messages_to_delete.append(msg)
+        ids = page if after_id is None else array('Q', (i for i in page if i > after_id))
+        if ids:
+            stats.candidates += len(ids)
+            yield ids
 
-        before_message = page[-1]
+        if len(ids) < len(page) or len(page) < 100:
+            return
+        before = discord.Object(id=page[-1])
+
+# Marker the pager puts between pages: every page before it has been fully handled
+# once the deleter reaches it, so the remaining windows are a safe resume point
+@dataclass
+class ScanCheckpoint:
+    windows: list[tuple[int | None, int | None]]
+
+# Merges (after, before) ID windows into disjoint ones, newest first
+def merge_windows(windows):
+    merged = []
+    for after, before in sorted(windows, key=lambda w: -1 if w[0] is None else w[0]):
+        if merged and (after is None or merged[-1][1] is None or after <= merged[-1][1]):
+            prev_after, prev_before = merged[-1]
+            merged[-1] = (prev_after, None if None in (prev_before, before) else max(prev_before, before))
+        else:
+            merged.append((after, before))
+    merged.reverse()
+    return merged
+
+# Scans each window newest-first, emitting a checkpoint every `checkpoint_every` pages
+async def window_pages(channel, windows, stats: SweepStats, checkpoint_every: int = 0):
+    for i, (after, before) in enumerate(windows):
+        pages = 0
+        cursor = discord.Object(id=before) if before is not None else None
+        async for ids in history_id_pages(channel, cursor, after, stats):
+            yield ids
+            pages += 1
+            if checkpoint_every and pages % checkpoint_every == 0:
+                yield ScanCheckpoint([(after, ids[-1])] + windows[i + 1:])
+
+# Producer side of the pipeline: a None sentinel tells the deleter the scan is over
+async def _scan_into_queue(pages, queue: asyncio.Queue):
+    try:
+        async for ids in pages:
+            await queue.put(ids)
+    except asyncio.CancelledError:
+        raise  # the deleter is gone, nobody is waiting for the sentinel
+    except Exception:
+        await queue.put(None)
+        raise
+    await queue.put(None)
+
+async def _bulk_delete(channel, ids: array, stats: SweepStats):
+    ch_id = channel.id
+    async def bulk_call():
+        started = time.monotonic()
+        await channel.delete_messages([discord.Object(id=i) for i in ids])
+        return time.monotonic() - started
 
-    # Delete gathered messages (respect cancellation)
-    for msg in messages_to_delete:
-        if is_cancelled(ch_id):
-            logger.warning(f"Deletion cancelled for channel {ch_id} mid-delete. Progress: {deleted_count}/{len(messages_to_delete)}")
-            return deleted_count
+    try:
+        latency = await deletion_dispatcher.submit('bulk_delete', ch_id, bulk_call)
+    except discord.Forbidden:
+        logger.error(f"Forbidden bulk deleting {len(ids)} messages in channel {ch_id}")
+        stats.failed_ids.extend(ids)
+        return
+    except discord.HTTPException as e:
+        # Whatever the bulk endpoint refuses gets another chance one by one
+        logger.warning(f"HTTP error bulk deleting {len(ids)} messages in channel {ch_id}, falling back to single deletes: {e}")
+        for message_id in ids:
+            await _single_delete(channel, message_id, stats)
+        return
+    stats.batch_latencies.append(latency)
+    stats.bulk_deleted += len(ids)
+    if stats.handled_ids is not None:
+        stats.handled_ids.extend(ids)
+    MESSAGES_DELETED.inc(len(ids), mode='bulk')
+    logger.info(f"Bulk deleted batch {len(stats.batch_latencies)} ({len(ids)} messages) in channel {ch_id} in {latency * 1000:.0f} ms")
+
+async def _single_delete(channel, message_id: int, stats: SweepStats, lane: str = 'fast'):
+    try:
+        await deletion_dispatcher.submit('delete_message', channel.id, channel.get_partial_message(message_id).delete, lane=lane)
+        stats.single_deleted += 1
+        MESSAGES_DELETED.inc(mode='single')
+        if stats.handled_ids is not None:
+            stats.handled_ids.append(message_id)
+    except discord.NotFound:
+        logger.debug(f"Message {message_id} was already deleted")
+        if stats.handled_ids is not None:
+            stats.handled_ids.append(message_id)
+    except discord.Forbidden:
+        logger.error(f"Forbidden deleting message {message_id}")
+        stats.failed_ids.append(message_id)
+    except discord.HTTPException as e:
+        logger.error(f"HTTP error deleting message {message_id}: {e}")
+        stats.failed_ids.append(message_id)
+
+# Consumer side of the pipeline: buffers bulk-eligible IDs into batches of up to 100
+# for the fast lane and deletes anything past the 14-day bulk limit one at a time on
+# the legacy lane (or hands it to the background drain)
+async def _delete_from_queue(channel, queue: asyncio.Queue, stats: SweepStats, on_checkpoint=None):
+    buffer = array('Q')
+    while True:
+        with span('queue_wait'):
+            ids = await queue.get()
+        if ids is None:
+            break
+        if isinstance(ids, ScanCheckpoint):
+            # flush the partial batch so everything scanned so far is really handled
+            if buffer:
+                await _bulk_delete(channel, buffer, stats)
+                buffer = array('Q')
+            if on_checkpoint:
+                with span('checkpoint'):
+                    on_checkpoint(ids.windows)
+            continue
+        with span('filter'):
+            # Recomputed per page so a long sweep doesn't send messages that aged out meanwhile
+            bulk_limit_id = discord.utils.time_snowflake(datetime.now(CET) - BULK_DELETE_MAX_AGE + BULK_DELETE_SAFETY_MARGIN)
+            recent = array('Q', (i for i in ids if i > bulk_limit_id))
+            legacy = array('Q', (i for i in ids if i <= bulk_limit_id))
+        for message_id in recent:
+            buffer.append(message_id)
+            if len(buffer) == BULK_DELETE_MAX_MESSAGES:
+                await _bulk_delete(channel, buffer, stats)
+                buffer = array('Q')
+        if legacy and stats.legacy_handoff:
+            stats.legacy_handed_off += len(legacy)
+            stats.legacy_newest_id = max(stats.legacy_newest_id, max(legacy))
+            legacy_lane.enqueue(channel, legacy)
+            if stats.handled_ids is not None:
+                stats.handled_ids.extend(legacy)
+        elif legacy:
+            for message_id in legacy:
+                await _single_delete(channel, message_id, stats, lane='legacy')
+    if buffer:
+        await _bulk_delete(channel, buffer, stats)
+
+# Runs the scan→delete pipeline: the pager and the deleter are joined by a bounded
+# queue of ID pages, so deletion starts after the first page and memory stays flat.
+# The pager and the deleter run as their own tasks inside a cancellation scope, so
+# stopping the sweep (or its deadline passing) interrupts whatever they are awaiting.
+async def run_sweep(channel, pages, stats: SweepStats, on_checkpoint=None, kind: str = 'manual', timeout: float | None = None):
+    ch_id = channel.id
+    queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+    trace = SweepTrace(kind, ch_id)
+    trace_token = current_trace.set(trace)  # both pipeline tasks inherit it
+    producer = asyncio.create_task(_scan_into_queue(pages, queue))
+    deleter = asyncio.create_task(_delete_from_queue(channel, queue, stats, on_checkpoint))
+    scope = sweep_scopes.open(ch_id, kind, stats, (deleter, producer))
+    profiler = None
+    if ch_id in profiled_channels:
+        profiler = asyncio.create_task(profile_tasks(trace, (deleter, producer)))
+    started = time.monotonic()
+    result = 'error'
+    try:
+        done, _ = await asyncio.wait({deleter}, timeout=timeout)
+        if not done:
+            scope.cancel('deadline')
+            await asyncio.wait({deleter})
+        if deleter.cancelled():
+            stats.cancelled = True
+            result = 'timeout' if scope.reason == 'deadline' else 'cancelled'
+        else:
+            deleter.result()  # surface delete errors
+            await producer  # surface scan errors
+            result = 'completed'
+    except asyncio.CancelledError:
+        # the task running the sweep was cancelled itself
+        result = 'cancelled'
+        raise
+    finally:
+        for task in (deleter, producer):
+            if not task.done():
+                task.cancel()
+        sweep_scopes.close(scope)
+        if profiler:
+            profiler.cancel()
+        current_trace.reset(trace_token)
+        SWEEP_SECONDS.observe(time.monotonic() - started, kind=kind)
+        SWEEPS.inc(kind=kind, result=result)
+        if TRACE_FILE:
+            trace_logger.info(json.dumps(trace.record(result, stats)))
+
+    if stats.cancelled:
+        logger.warning(f"Sweep of channel {ch_id} stopped ({scope.reason}). Progress: {stats.deleted}/{stats.candidates}")
+    if stats.candidates:
+        avg_ms = (sum(stats.batch_latencies) / len(stats.batch_latencies) * 1000) if stats.batch_latencies else 0
+        logger.info(
+            f"Channel {ch_id}: {stats.bulk_deleted} messages bulk deleted in {len(stats.batch_latencies)} batches "
+            f"(avg {avg_ms:.0f} ms/batch), {stats.single_deleted} single deletes"
+        )
+
+# Threads of `channel` that may hold messages in the window (after_id, before_id).
+# Active threads come from the gateway cache and archived ones are paged most recently
+# archived first. A thread whose ID is above `before_id` was created after the cutoff,
+# so all of its messages are too new; one whose last message is at or below `after_id`
+# has nothing in the window. Paging stops at the first thread archived before `after_id`.
+async def candidate_threads(channel, after_id: int | None, before_id: int | None):
+    seen = set()
+
+    def wanted(thread) -> bool:
+        if thread.id in seen:
+            return False
+        seen.add(thread.id)
+        if before_id is not None and thread.id >= before_id:
+            return False
+        last = thread.last_message_id
+        return last is None or after_id is None or last > after_id
+
+    for thread in list(channel.threads):
+        if wanted(thread):
+            yield thread
+
+    # Discord refuses deletes in archived threads, so they are unarchived for their sweep
+    # and archived again afterwards, which needs Manage Threads
+    if not channel.permissions_for(channel.guild.me).manage_threads:
+        logger.info(f"Skipping archived threads of channel {channel.id}: missing Manage Threads")
+        return
+    # forums only have public posts
+    listings = [{}]
+    if isinstance(channel, discord.TextChannel):
+        listings = [{'private': False}, {'private': True}]
+    for options in listings:
         try:
-            await msg.delete()
-            deleted_count += 1
-        except discord.Forbidden:
-            logger.error(f"Forbidden deleting message {msg.id}")
+            async for thread in channel.archived_threads(limit=None, **options):
+                archived = thread.archive_timestamp
+                if after_id is not None and archived and discord.utils.time_snowflake(archived) <= after_id:
+                    break
+                if wanted(thread):
+                    yield thread
         except discord.HTTPException as e:
-            logger.error(f"HTTP error deleting message {msg.id}: {e}")
-        await asyncio.sleep(1)  # rate-limit friendly
+            logger.warning(f"Could not list {'private' if options.get('private') else 'public'} archived threads of channel {channel.id}: {e}")
 
-    return deleted_count
+async def prepend_page(first, pages):
+    yield first
+    async for ids in pages:
+        yield ids
 
-# ------------------- Persistence -------------------
-
-def save_state():
+async def rearchive(thread):
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state, f)
-        logger.info("State saved successfully")
-    except Exception as e:
-        logger.error(f"Error saving state file: {e}")
+        await thread.edit(archived=True)
+    except discord.HTTPException as e:
+        logger.warning(f"Could not archive thread {thread.id} again after sweeping it: {e}")
+
+# Sweeps the candidate threads of `channel` with a bounded pool of workers, all sharing
+# the same window and deadline. The lister and the workers run inside one scope of the
+# channel, so stopping the channel stops the whole fan-out, not just the thread sweeps
+# running at that moment. The returned stats add up every thread; `cancelled` is set if
+# any thread sweep didn't finish.
+async def sweep_threads(channel, after_id: int | None, before_id: int | None, kind: str, timeout: float | None = None) -> SweepStats:
+    total = SweepStats()
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    queue = asyncio.Queue(maxsize=THREAD_SWEEP_CONCURRENCY)
+    before = discord.Object(id=before_id) if before_id is not None else None
+    swept = 0
+    stopped = False  # a thread sweep was stopped before the deadline: take no more threads
+
+    def out_of_time() -> bool:
+        return deadline is not None and loop.time() >= deadline
+
+    async def worker():
+        nonlocal swept, stopped
+        while True:
+            thread = await queue.get()
+            if thread is None:
+                return
+            if stopped or out_of_time():
+                total.cancelled = True
+                continue
+            remaining = None if deadline is None else deadline - loop.time()
+            stats = SweepStats()
+            unarchived = False
+            try:
+                pages = history_id_pages(thread, before, after_id, stats)
+                if thread.archived:
+                    # history can be read while archived; only unarchive if there is work
+                    first = await anext(pages, None)
+                    if first is None:
+                        continue
+                    await thread.edit(archived=False)
+                    unarchived = True
+                    pages = prepend_page(first, pages)
+                await run_sweep(thread, pages, stats, kind='thread', timeout=remaining)
+                if stats.cancelled and not out_of_time():
+                    stopped = True
+            except Exception as e:
+                logger.error(f"Error sweeping thread {thread.id} of channel {channel.id}: {e}")
+                stats.cancelled = True
+            except asyncio.CancelledError:
+                stats.cancelled = True
+                raise
+            finally:
+                # a stopped thread still counts what it deleted
+                swept += 1
+                total.pages_scanned += stats.pages_scanned
+                total.candidates += stats.candidates
+                total.bulk_deleted += stats.bulk_deleted
+                total.single_deleted += stats.single_deleted
+                total.failed_ids.extend(stats.failed_ids)
+                total.cancelled = total.cancelled or stats.cancelled
+                if unarchived:
+                    await rearchive(thread)
+
+    async def list_threads():
+        async for thread in candidate_threads(channel, after_id, before_id):
+            if stopped or out_of_time():
+                total.cancelled = True
+                break
+            await queue.put(thread)
+        for _ in workers:
+            await queue.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(THREAD_SWEEP_CONCURRENCY)]
+    lister = asyncio.create_task(list_threads())
+    tasks = (lister, *workers)
+    scope = sweep_scopes.open(channel.id, kind, total, tasks)
+    try:
+        # a failing lister ends the fan-out; the workers would wait for it forever
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        if scope.reason is not None:
+            total.cancelled = True
+        elif lister.done() and not lister.cancelled():
+            lister.result()  # surface listing errors
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        sweep_scopes.close(scope)
+
+    if total.failed_ids:
+        # pending retries are per channel, so thread failures are only reported
+        logger.warning(f"{len(total.failed_ids)} messages in threads of channel {channel.id} could not be deleted")
+    if swept:
+        logger.info(f"Swept {swept} threads of channel {channel.id}: {total.deleted} messages deleted")
+    return total
+
+# ------------------- Sweep planner -------------------
+
+# Result of a dry-run scan: the IDs a manual run over (after_id, before_id) would find,
+# newest first, split by whether the bulk endpoint still accepts them. Timestamps come
+# from the snowflakes, so the scan reads IDs only. An open-ended scan records the time
+# it started as its upper bound.
+@dataclass
+class SweepPlan:
+    channel_id: int
+    before_id: int
+    after_id: int | None
+    ids: array
+    bulk: int = 0
+    single: int = 0
+    pages: int = 0
+    scan_seconds: float = 0.0
+    complete: bool = True
+    created: float = field(default_factory=time.monotonic)
+
+    @property
+    def total(self) -> int:
+        return self.bulk + self.single
+
+    @property
+    def bulk_calls(self) -> int:
+        return -(-self.bulk // BULK_DELETE_MAX_MESSAGES)
+
+# Latest complete plan per channel, picked up by the next manual run over the same range
+sweep_plans: dict[int, SweepPlan] = {}
+
+async def plan_sweep(channel, before, after_id: int | None) -> SweepPlan:
+    stats = SweepStats()
+    upper_id = before.id if before else discord.utils.time_snowflake(datetime.now(CET), high=False)
+    plan = SweepPlan(channel.id, upper_id, after_id, array('Q'))
+    bulk_limit_id = discord.utils.time_snowflake(datetime.now(CET) - BULK_DELETE_MAX_AGE + BULK_DELETE_SAFETY_MARGIN)
+    started = time.monotonic()
+    async for ids in history_id_pages(channel, before, after_id, stats):
+        plan.pages += 1
+        bulk = sum(1 for i in ids if i > bulk_limit_id)
+        plan.bulk += bulk
+        plan.single += len(ids) - bulk
+        if len(plan.ids) + len(ids) <= PLAN_CACHE_MAX_IDS:
+            plan.ids.extend(ids)
+        if time.monotonic() - started > PLAN_SCAN_TIMEOUT_SECONDS:
+            plan.complete = False
+            break
+    plan.scan_seconds = time.monotonic() - started
+    if plan.complete and len(plan.ids) == plan.total:
+        sweep_plans[channel.id] = plan
+    else:
+        sweep_plans.pop(channel.id, None)
+        plan.ids = array('Q')
+    return plan
+
+# Seconds to send `calls` requests on a route paced at `route_rate` that grows by the
+# dispatcher's additive step after every success, capped by the lane's share
+def projected_seconds(calls: int, route_rate: float, lane_rate: float) -> float:
+    seconds = 0.0
+    rate = route_rate
+    while calls and rate < DISPATCH_ROUTE_MAX_RATE and rate < lane_rate:
+        seconds += 1 / rate
+        rate += DISPATCH_ROUTE_RATE_STEP
+        calls -= 1
+    return seconds + calls / min(rate, DISPATCH_ROUTE_MAX_RATE, lane_rate)
+
+# Projected wall time of deleting a plan at the channel's current dispatcher rates
+def projected_delete_seconds(plan: SweepPlan) -> float:
+    bulk = projected_seconds(plan.bulk_calls, deletion_dispatcher.route_rate('bulk_delete', plan.channel_id),
+                             deletion_dispatcher.lane_rate('fast'))
+    single = projected_seconds(plan.single, deletion_dispatcher.route_rate('delete_message', plan.channel_id),
+                               deletion_dispatcher.lane_rate('legacy'))
+    return bulk + single
+
+# Pages for a manual run over (after_id, before): a fresh plan covering the range is
+# used instead of history, topped up with whatever was posted above its upper bound
+async def planned_pages(channel, before, after_id: int | None, stats: SweepStats):
+    plan = sweep_plans.pop(channel.id, None)
+    usable = (
+        plan is not None
+        and time.monotonic() - plan.created <= PLAN_CACHE_SECONDS
+        and (before is None or plan.before_id <= before.id)
+        and (plan.after_id is None or (after_id is not None and plan.after_id <= after_id))
+    )
+    if not usable:
+        async for ids in history_id_pages(channel, before, after_id, stats):
+            yield ids
+        return
+
+    logger.info(f"Reusing the planned scan of {len(plan.ids)} messages in channel {channel.id}")
+    if before is None or before.id > plan.before_id:
+        async for ids in history_id_pages(channel, before, max(plan.before_id - 1, after_id or 0), stats):
+            yield ids
+    # an open-ended scan may have seen messages posted above its bound; the top-up has them
+    ids = array('Q', (i for i in plan.ids if i < plan.before_id and (after_id is None or i > after_id)))
+    for start in range(0, len(ids), BULK_DELETE_MAX_MESSAGES):
+        page = ids[start:start + BULK_DELETE_MAX_MESSAGES]
+        stats.candidates += len(page)
+        yield page
+
+# Deletes messages older than `older_than` and/or at least as new as `newer_than`.
+# When both bounds are given the sweep covers the window between them.
+async def delete_messages(channel, older_than: datetime | None, newer_than: datetime | None = None):
+    stats = SweepStats()
+
+    if older_than is None and newer_than is None:
+        # nothing to delete if no condition given
+        return stats.deleted
+
+    # Page newest-first from the upper bound and stop once the lower bound is crossed,
+    # so the scan only touches messages that are actually in range
+    before, after_id = snowflake_bounds(older_than, newer_than)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    if isinstance(channel, discord.TextChannel):
+        await run_sweep(channel, planned_pages(channel, before, after_id, stats), stats, timeout=MANUAL_SWEEP_TIMEOUT_SECONDS)
+    if CLEAN_THREADS and not stats.cancelled:
+        timeout = None if MANUAL_SWEEP_TIMEOUT_SECONDS is None else MANUAL_SWEEP_TIMEOUT_SECONDS - (loop.time() - started)
+        thread_stats = await sweep_threads(channel, after_id, before.id if before else None, kind='manual', timeout=timeout)
+        return stats.deleted + thread_stats.deleted
+    return stats.deleted
 
 # Run the bot
-bot.run(TOKEN)
+if __name__ == '__main__':
+    bot.run(TOKEN)
+    state_store.close()
+    leader_lease.release()
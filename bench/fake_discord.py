@@ -0,0 +1,327 @@
+# In-process stand-in for the parts of Discord that CleanBotman talks to: a text
+# channel with a synthetic snowflake history, history pagination, bulk and single
+# delete endpoints, rate-limit buckets that answer with 429s, and random 5xx errors.
+# Rate-limited requests are retried the way discord.py does it internally (log a
+# warning on `discord.http`, sleep `retry_after`, try again), so the bot's own
+# rate-limit observer sees them exactly as it would in production.
+
+import asyncio
+import bisect
+import logging
+import random
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import discord
+
+http_log = logging.getLogger('discord.http')
+
+API_BASE = 'https://discord.com/api/v10'
+
+# Approximations of Discord's published per-channel buckets: (requests, per seconds)
+ROUTE_LIMITS = {
+    'history': (5, 5.0),
+    'bulk_delete': (1, 1.0),
+    'delete_message': (5, 5.0),
+    'delete_message_old': (3, 5.0),  # messages past 14 days sit in a slower bucket
+    'archived_threads': (10, 10.0),
+    'edit_thread': (5, 5.0),
+}
+ARCHIVED_THREADS_PAGE = 50
+GLOBAL_LIMIT = (50, 1.0)
+BULK_MAX_AGE = timedelta(days=14)
+
+
+class FakeResponse:
+    def __init__(self, status: int, reason: str, headers=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class FixedWindow:
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.window_start = 0.0
+        self.used = 0
+
+    # Returns 0 if the request may go now, otherwise the seconds until the window resets
+    def hit(self, now: float) -> float:
+        if now - self.window_start >= self.per:
+            self.window_start = now
+            self.used = 0
+        if self.used < self.limit:
+            self.used += 1
+            return 0.0
+        return self.per - (now - self.window_start)
+
+
+# Shared request layer: latency, rate-limit buckets, 5xx injection and call counts.
+# History 5xx errors are surfaced to the caller so the bot's own retry path runs;
+# delete 5xx errors are retried here, as discord.py does.
+class FakeHTTP:
+    def __init__(self, speedup: float = 1.0, latency=(0.08, 0.15), error_rate: float = 0.0, seed: int = 0):
+        self.speedup = speedup
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.server_errors = Counter()
+        self._buckets: dict[tuple[str, int], FixedWindow] = {}
+        per_global = GLOBAL_LIMIT[1] / speedup
+        self._global = FixedWindow(GLOBAL_LIMIT[0], per_global)
+
+    def _bucket(self, route: str, channel_id: int) -> FixedWindow:
+        bucket = self._buckets.get((route, channel_id))
+        if bucket is None:
+            limit, per = ROUTE_LIMITS[route]
+            bucket = FixedWindow(limit, per / self.speedup)
+            self._buckets[(route, channel_id)] = bucket
+        return bucket
+
+    async def request(self, route: str, channel_id: int, method: str, url: str, retry_5xx: bool):
+        bucket = self._bucket(route, channel_id)
+        for _ in range(5):
+            now = time.monotonic()
+            retry_after = self._global.hit(now)
+            is_global = retry_after > 0
+            if not is_global:
+                retry_after = bucket.hit(now)
+            if retry_after > 0:
+                self.rate_limited[route] += 1
+                http_log.warning('We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.',
+                                 method, url, retry_after)
+                if is_global:
+                    http_log.warning('Global rate limit has been hit. Retrying in %.2f seconds.', retry_after)
+                await asyncio.sleep(retry_after)
+                continue
+
+            self.calls[route] += 1
+            await asyncio.sleep(self.random.uniform(*self.latency) / self.speedup)
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.server_errors[route] += 1
+                if retry_5xx:
+                    # discord.py retries 500/502/504 on its own after a short sleep
+                    await asyncio.sleep(1 / self.speedup)
+                    continue
+                raise discord.DiscordServerError(FakeResponse(500, 'Internal Server Error'), 'injected 5xx')
+            return
+        raise discord.HTTPException(FakeResponse(429, 'Too Many Requests', {'Retry-After': '1'}), 'rate limited')
+
+
+class FakeMessage:
+    __slots__ = ('id', 'channel')
+
+    def __init__(self, channel, message_id: int):
+        self.id = message_id
+        self.channel = channel
+
+    @property
+    def created_at(self):
+        return discord.utils.snowflake_time(self.id)
+
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id: int):
+        self.channel = channel
+        self.id = message_id
+
+    async def delete(self):
+        await self.channel._delete_one(self.id)
+
+
+class FakePermissions:
+    manage_messages = True
+    manage_threads = True
+
+
+# Message history kept as a sorted array of snowflakes; deleted IDs are tombstoned
+# and compacted away in bulk so huge histories stay cheap to page. Subclasses
+# discord.TextChannel (without its gateway state) so the bot's isinstance checks pass.
+class FakeTextChannel(discord.TextChannel):
+    def __init__(self, channel_id: int, message_ids, http: FakeHTTP, name: str = 'bench'):
+        self.id = channel_id
+        self.name = name
+        self.guild = None
+        self.http = http
+        self._ids = array('Q', sorted(message_ids))
+        self._deleted: set[int] = set()
+        self.deleted_count = 0
+        # threads under this channel; a thread is itself a FakeTextChannel
+        self.active_threads: list[FakeTextChannel] = []
+        self.archived_list: list[FakeTextChannel] = []  # most recently archived first
+        self.archive_timestamp: datetime | None = None
+        self.archived = False
+
+    @property
+    def threads(self):
+        return list(self.active_threads)
+
+    @property
+    def last_message_id(self):
+        for message_id in reversed(self._ids):
+            if message_id not in self._deleted:
+                return message_id
+        return None
+
+    def archived_threads(self, *, limit=100, before=None, private=False, joined=False):
+        return self._archived_threads(private)
+
+    async def _archived_threads(self, private):
+        if private:
+            return
+        for start in range(0, len(self.archived_list), ARCHIVED_THREADS_PAGE):
+            await self.http.request('archived_threads', self.id, 'GET',
+                                    f'{API_BASE}/channels/{self.id}/threads/archived/public', retry_5xx=True)
+            for thread in self.archived_list[start:start + ARCHIVED_THREADS_PAGE]:
+                yield thread
+
+    # Unarchiving / archiving a thread; Discord refuses deletes while it is archived
+    async def edit(self, *, archived: bool):
+        await self.http.request('edit_thread', self.id, 'PATCH', f'{API_BASE}/channels/{self.id}', retry_5xx=True)
+        self.archived = archived
+        if archived:
+            self.archive_timestamp = datetime.now(timezone.utc)
+
+    def _check_not_archived(self):
+        if self.archived:
+            raise discord.HTTPException(FakeResponse(400, 'Bad Request'),
+                                        {'code': 50083, 'message': 'Operation cannot be performed on an archived thread.'})
+
+    def deleted_total(self) -> int:
+        threads = self.active_threads + self.archived_list
+        return self.deleted_count + sum(thread.deleted_count for thread in threads)
+
+    def __len__(self):
+        return len(self._ids) - len(self._deleted)
+
+    def _compact(self):
+        if len(self._deleted) * 4 > len(self._ids):
+            self._ids = array('Q', (i for i in self._ids if i not in self._deleted))
+            self._deleted.clear()
+
+    def _remove(self, message_id: int) -> bool:
+        pos = bisect.bisect_left(self._ids, message_id)
+        if pos == len(self._ids) or self._ids[pos] != message_id or message_id in self._deleted:
+            return False
+        self._deleted.add(message_id)
+        self.deleted_count += 1
+        return True
+
+    def history(self, *, limit=100, before=None, after=None, oldest_first=None):
+        return self._history(limit, before, after)
+
+    async def _history(self, limit, before, after):
+        await self.http.request('history', self.id, 'GET', f'{API_BASE}/channels/{self.id}/messages', retry_5xx=False)
+        upper = before.id if before is not None else 1 << 64
+        lower = after.id if after is not None else -1
+        pos = bisect.bisect_left(self._ids, upper) - 1
+        page = []
+        while pos >= 0 and len(page) < limit:
+            message_id = self._ids[pos]
+            if message_id <= lower:
+                break
+            if message_id not in self._deleted:
+                page.append(message_id)
+            pos -= 1
+        for message_id in page:
+            yield FakeMessage(self, message_id)
+
+    async def delete_messages(self, messages, *, reason=None):
+        messages = list(messages)
+        if not messages:
+            return
+        if len(messages) == 1:
+            await self._delete_one(messages[0].id)
+            return
+        if len(messages) > 100:
+            raise discord.ClientException('Can only bulk delete messages up to 100 messages')
+        await self.http.request('bulk_delete', self.id, 'POST',
+                                f'{API_BASE}/channels/{self.id}/messages/bulk-delete', retry_5xx=True)
+        self._check_not_archived()
+        oldest_allowed = datetime.now(timezone.utc) - BULK_MAX_AGE
+        if any(discord.utils.snowflake_time(m.id) < oldest_allowed for m in messages):
+            raise discord.HTTPException(FakeResponse(400, 'Bad Request'),
+                                        {'code': 50034, 'message': 'You can only bulk delete messages that are under 14 days old.'})
+        for m in messages:
+            self._remove(m.id)
+        self._compact()
+
+    async def _delete_one(self, message_id: int):
+        old = discord.utils.snowflake_time(message_id) < datetime.now(timezone.utc) - BULK_MAX_AGE
+        route = 'delete_message_old' if old else 'delete_message'
+        await self.http.request(route, self.id, 'DELETE',
+                                f'{API_BASE}/channels/{self.id}/messages/{message_id}', retry_5xx=True)
+        self._check_not_archived()
+        if not self._remove(message_id):
+            raise discord.NotFound(FakeResponse(404, 'Not Found'), {'code': 10008, 'message': 'Unknown Message'})
+        self._compact()
+
+    def get_partial_message(self, message_id: int):
+        return FakePartialMessage(self, message_id)
+
+    def permissions_for(self, member):
+        return FakePermissions()
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, channels):
+        self.id = guild_id
+        self.me = object()
+        self.text_channels = list(channels)
+        self.forums = []
+        for channel in self.text_channels:
+            channel.guild = self
+
+    def get_channel(self, channel_id: int):
+        return next((c for c in self.text_channels if c.id == channel_id), None)
+
+
+class FakeBot:
+    def __init__(self, guilds):
+        self.guilds = list(guilds)
+
+
+# `count` snowflakes spread over `span` up to `end` (default: now), denser towards the end
+def synthetic_history(count: int, span: timedelta, end: datetime | None = None, seed: int = 0) -> array:
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc)
+    start = end - span
+    start_s = start.timestamp()
+    span_s = span.total_seconds()
+    stamps = sorted(rng.random() ** 0.8 for _ in range(count))
+    ids = array('Q')
+    for seq, fraction in enumerate(stamps):
+        when = datetime.fromtimestamp(start_s + fraction * span_s, tz=timezone.utc)
+        ids.append(discord.utils.time_snowflake(when) + (seq & 0x3FFFFF))
+    return array('Q', sorted(set(ids)))
+
+
+# Adds `count` threads to `parent`, splitting `message_ids` between them; every other
+# thread is archived (archived at its newest message's time)
+def add_threads(parent: FakeTextChannel, message_ids, count: int, http: FakeHTTP):
+    ids = sorted(message_ids)
+    per_thread = max(1, len(ids) // count)
+    for i in range(count):
+        chunk = ids[i * per_thread:(i + 1) * per_thread] if i < count - 1 else ids[i * per_thread:]
+        if not chunk:
+            break
+        # a thread's ID is never above its first message
+        thread = FakeTextChannel(chunk[0] - 1, chunk, http, name=f'{parent.name}-thread-{i}')
+        if i % 2:
+            thread.archived = True
+            thread.archive_timestamp = discord.utils.snowflake_time(chunk[-1])
+            parent.archived_list.append(thread)
+        else:
+            parent.active_threads.append(thread)
+    parent.archived_list.sort(key=lambda t: t.archive_timestamp, reverse=True)
+
+
+# Points CleanBotman's channel lookups at the fake channels
+def install(bot_module, channels, guild_id: int = 1):
+    bot_module.bot = FakeBot([FakeGuild(guild_id, channels)])
+    bot_module.channel_registry.rebuild()
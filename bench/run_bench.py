@@ -0,0 +1,179 @@
+# Offline benchmarks for CleanBotman's sweep pipeline against the in-process fake
+# Discord in fake_discord.py, so performance regressions show up without a network.
+#
+#     python bench/run_bench.py                         # every scenario, 100k messages
+#     python bench/run_bench.py --scenario scheduled --messages 250000 --error-rate 0.01
+#
+# Rates, latencies and backoffs are compressed by --speedup so a run that would take
+# an hour against Discord finishes in about a minute; "sim time" undoes that factor.
+# Each scenario reports wall time, API calls by route, 429s, 5xx errors, peak traced
+# memory and messages deleted per second.
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# Keep the bot's state store out of the working tree
+os.chdir(tempfile.mkdtemp(prefix='cleanbot-bench-'))
+os.environ['CLEANER_STATE_BACKEND'] = 'sqlite'
+os.environ['CLEANER_STATE_DB'] = 'bench.db'
+os.environ['CLEANER_METRICS_PORT'] = '0'
+
+import logging  # noqa: E402
+
+import CleanBotman as cb  # noqa: E402
+import fake_discord as fd  # noqa: E402
+
+logging.getLogger().setLevel(logging.ERROR)
+# The bot's rate-limit observer still sees discord.http records; keep them off the console
+logging.getLogger('discord.http').propagate = False
+
+# Module settings that are rates (scaled up) or durations (scaled down) by --speedup
+RATE_SETTINGS = ('DISPATCH_GLOBAL_RATE', 'DISPATCH_ROUTE_INITIAL_RATE', 'DISPATCH_ROUTE_MIN_RATE',
+                 'DISPATCH_ROUTE_MAX_RATE', 'DISPATCH_ROUTE_RATE_STEP')
+DURATION_SETTINGS = ('SERVER_ERROR_RETRY_SECONDS',)
+DEFAULTS = {name: getattr(cb, name) for name in RATE_SETTINGS + DURATION_SETTINGS}
+
+CHANNEL_ID_BASE = 900_000_000_000_000_000
+
+
+def configure(speedup: float):
+    for name in RATE_SETTINGS:
+        setattr(cb, name, DEFAULTS[name] * speedup)
+    for name in DURATION_SETTINGS:
+        setattr(cb, name, tuple(v / speedup for v in DEFAULTS[name]))
+
+
+# Fresh bot-side state for every scenario
+def reset_bot():
+    cb.state.clear()
+    cb.sweep_cursors.clear()
+    cb.sweep_scopes = cb.SweepScopes()
+    cb.expiry_index.invalidate_all()
+    cb.deletion_dispatcher = cb.DeletionDispatcher(cb.DISPATCH_GLOBAL_RATE, cb.DISPATCH_MAX_CONCURRENCY, cb.DISPATCH_LANE_SHARES)
+    cb.legacy_lane = cb.LegacyLane()
+
+
+def make_channels(args, http, count=1):
+    per_channel = args.messages // count
+    return [
+        fd.FakeTextChannel(CHANNEL_ID_BASE + i,
+                           fd.synthetic_history(per_channel, timedelta(days=args.days), seed=args.seed + i),
+                           http, name=f'bench-{i}')
+        for i in range(count)
+    ]
+
+
+async def wait_for_drains(channels):
+    while any(cb.legacy_lane.is_draining(ch.id) for ch in channels):
+        await asyncio.sleep(0.05)
+
+
+async def scenario_scheduled(args, channels):
+    for ch in channels:
+        cb.state[str(ch.id)] = {'time_to_keep': args.keep_hours}
+    await asyncio.gather(*(cb.clean_old_messages(ch.id) for ch in channels))
+    await wait_for_drains(channels)
+
+
+async def scenario_all(args, channels):
+    now = datetime.now(cb.CET)
+    await asyncio.gather(*(cb.delete_messages(ch, older_than=now, newer_than=datetime(1970, 1, 1, tzinfo=cb.CET))
+                           for ch in channels))
+
+
+async def scenario_last(args, channels):
+    delta = cb.parse_last_duration(args.last)
+    if delta is None:
+        raise SystemExit(f"--last must look like last<Nd><Nh><Nm>, got {args.last!r}")
+    start_time = datetime.now(cb.CET) - delta
+    await asyncio.gather(*(cb.delete_messages(ch, older_than=None, newer_than=start_time) for ch in channels))
+
+
+# name -> (runner, number of channels the messages are spread over, whether the channel
+# also gets --threads threads holding as many messages again, half of them archived)
+SCENARIOS = {
+    'scheduled': (scenario_scheduled, 1, False),
+    'scheduled-multi': (scenario_scheduled, 8, False),
+    'threads': (scenario_scheduled, 1, True),
+    'all': (scenario_all, 1, False),
+    'last': (scenario_last, 1, False),
+}
+
+
+async def run_scenario(name, args):
+    runner, channel_count, with_threads = SCENARIOS[name]
+    reset_bot()
+    http = fd.FakeHTTP(speedup=args.speedup, error_rate=args.error_rate, seed=args.seed)
+    channels = make_channels(args, http, channel_count)
+    if with_threads:
+        for ch in channels:
+            thread_ids = fd.synthetic_history(args.messages, timedelta(days=args.days), seed=args.seed + 1000)
+            fd.add_threads(ch, thread_ids, args.threads, http)
+    fd.install(cb, channels)
+    before = sum(len(ch) + sum(len(t) for t in ch.active_threads + ch.archived_list) for ch in channels)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await runner(args, channels)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    deleted = sum(ch.deleted_total() for ch in channels)
+    return {
+        'scenario': name,
+        'channels': channel_count,
+        'messages': before,
+        'deleted': deleted,
+        'wall_s': wall,
+        'sim_s': wall * args.speedup,
+        'api_calls': dict(http.calls),
+        'rate_limited': sum(http.rate_limited.values()),
+        'server_errors': sum(http.server_errors.values()),
+        'peak_mib': peak / (1024 * 1024),
+        'msgs_per_sim_s': deleted / (wall * args.speedup) if wall else 0.0,
+    }
+
+
+def print_result(r):
+    calls = ', '.join(f'{route}={n}' for route, n in sorted(r['api_calls'].items()))
+    print(f"{r['scenario']:<16} channels={r['channels']} messages={r['messages']} deleted={r['deleted']}")
+    print(f"{'':<16} wall={r['wall_s']:.2f}s sim={r['sim_s']:.0f}s msgs/s(sim)={r['msgs_per_sim_s']:.1f} "
+          f"peak={r['peak_mib']:.1f}MiB")
+    print(f"{'':<16} api: {calls or 'none'} | 429s={r['rate_limited']} 5xx={r['server_errors']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['every'], default='every')
+    parser.add_argument('--messages', type=int, default=100_000, help='messages per scenario (split across channels)')
+    parser.add_argument('--days', type=float, default=7.0, help='age of the oldest synthetic message')
+    parser.add_argument('--threads', type=int, default=20, help='threads in the threads scenario')
+    parser.add_argument('--keep-hours', type=int, default=24, help='time_to_keep for scheduled sweeps')
+    parser.add_argument('--last', default='last2d', help='duration for the last<Nd><Nh><Nm> scenario')
+    parser.add_argument('--speedup', type=float, default=50.0, help='time compression factor')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a 5xx per request')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+async def main(args):
+    configure(args.speedup)
+    names = sorted(SCENARIOS) if args.scenario == 'every' else [args.scenario]
+    for name in names:
+        print_result(await run_scenario(name, args))
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
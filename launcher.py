@@ -0,0 +1,140 @@
+# github.com/hitem
+#
+# Runs CleanBotman as several worker processes on one host. Each worker connects only
+# the shards it is given, so it loads, schedules and cleans only the channels of its own
+# guilds, and all workers share the sqlite state store. Crashed workers are restarted.
+#
+#     python launcher.py --workers 4              # 4 processes, one shard each
+#     python launcher.py --workers 2 --shards 8   # 2 processes, 4 shards each
+
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+logger = logging.getLogger()
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CleanBotman.py')
+
+# CleanBotman's default for CLEANER_TRACE_FILE
+DEFAULT_TRACE_FILE = 'cleaner_traces.jsonl'
+
+# Discord accepts one IDENTIFY per 5 seconds for most bots; stagger worker starts so their
+# shards don't compete for it
+IDENTIFY_INTERVAL_SECONDS = 5.0
+
+# Wait before restarting a worker that exited, doubling up to the maximum while it keeps failing
+RESTART_DELAY_SECONDS = 5.0
+MAX_RESTART_DELAY_SECONDS = 300.0
+# A worker that stayed up this long is considered healthy again
+HEALTHY_AFTER_SECONDS = 600.0
+
+def shard_slices(shard_count: int, workers: int) -> list[list[int]]:
+    return [list(range(i, shard_count, workers)) for i in range(workers)]
+
+def worker_env(shard_ids: list[int], shard_count: int, workers: int, index: int, metrics_port: int) -> dict:
+    env = dict(os.environ)
+    env['CLEANER_SHARD_COUNT'] = str(shard_count)
+    env['CLEANER_SHARD_IDS'] = ','.join(str(i) for i in shard_ids)
+    env['CLEANER_WORKERS'] = str(workers)
+    # one endpoint per worker: base, base + 1, ...
+    env['CLEANER_METRICS_PORT'] = str(metrics_port + index) if metrics_port else '0'
+    # one trace file per worker (cleaner_traces.0.jsonl, ...): a rotating log file
+    # can't be shared between processes
+    trace_file = os.environ.get('CLEANER_TRACE_FILE', DEFAULT_TRACE_FILE)
+    if trace_file:
+        root, ext = os.path.splitext(trace_file)
+        env['CLEANER_TRACE_FILE'] = f"{root}.{index}{ext}"
+    return env
+
+class Worker:
+    def __init__(self, index: int, shard_ids: list[int], env: dict):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.env = env
+        self.process: subprocess.Popen | None = None
+        self.started = 0.0
+        self.restart_delay = RESTART_DELAY_SECONDS
+        self.restart_at = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, BOT_SCRIPT], env=self.env)
+        self.started = time.monotonic()
+        logger.info(f"Worker {self.index} started (pid {self.process.pid}, shards {self.shard_ids})")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+def run(workers: list[Worker]):
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for worker in workers:
+        if stopping:
+            break
+        worker.start()
+        time.sleep(IDENTIFY_INTERVAL_SECONDS * len(worker.shard_ids))
+
+    while not stopping:
+        now = time.monotonic()
+        for worker in workers:
+            if worker.process is None:
+                if now >= worker.restart_at:
+                    worker.start()
+                continue
+            code = worker.process.poll()
+            if code is None:
+                continue
+            if now - worker.started >= HEALTHY_AFTER_SECONDS:
+                worker.restart_delay = RESTART_DELAY_SECONDS
+            logger.warning(f"Worker {worker.index} exited with code {code}; restarting in {worker.restart_delay:.0f}s")
+            worker.process = None
+            worker.restart_at = now + worker.restart_delay
+            worker.restart_delay = min(MAX_RESTART_DELAY_SECONDS, worker.restart_delay * 2)
+        time.sleep(1)
+
+    logger.info("Stopping workers")
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        if worker.process:
+            try:
+                worker.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run CleanBotman as several sharded worker processes")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count)")
+    parser.add_argument('--shards', type=int, default=0, help="total shard count (default: one per worker)")
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('CLEANER_METRICS_PORT', '0')),
+                        help="first worker's metrics port; worker N uses this plus N (default: off)")
+    args = parser.parse_args()
+
+    if os.environ.get('CLEANER_STATE_BACKEND', 'sqlite') != 'sqlite':
+        parser.error("workers share their state through sqlite; unset CLEANER_STATE_BACKEND")
+    shard_count = args.shards or args.workers
+    workers = min(args.workers, shard_count)
+    if workers < 1:
+        parser.error("--workers must be at least 1")
+
+    run([
+        Worker(i, shard_ids, worker_env(shard_ids, shard_count, workers, i, args.metrics_port))
+        for i, shard_ids in enumerate(shard_slices(shard_count, workers))
+    ])
+
+if __name__ == '__main__':
+    main()